@@ -49,7 +49,7 @@ class IORedirector:
 # --- BACKEND INTEGRATION (ZERO LOSS) ---
 try:
     from portable_scraper.core.config import app_config
-    from portable_scraper.core.pipeline import run_processing_pipeline
+    from portable_scraper.core.pipeline import run_processing_pipeline, start_spool_drainer
     from portable_scraper.modules.scholar_scraper import run_scholar_scraper
     from portable_scraper.modules.scopus_scraper import run_scopus_scraper
     from portable_scraper.modules.wos_scraper import launch_wos_browser, attach_and_scrape_wos
@@ -128,6 +128,8 @@ class PulseController(MasterpieceView):
         self.show_dash()
         self.pulse_status_dot()
         threading.Thread(target=self.refresh_dashboard_stats, daemon=True).start()
+        # Replays payloads spooled during an earlier outage (no-op when the spool is empty)
+        start_spool_drainer()
 
     def on_closing(self):
         self.is_alive = False
@@ -203,7 +205,7 @@ class PulseController(MasterpieceView):
             
             if payload:
                 self.log_to_terminal("Stage 3/7: Running Identity Resolution & Linker...")
-                run_processing_pipeline("scholar", payload)
+                run_processing_pipeline("scholar", payload, payload_path=path)
                 self.log_to_terminal("Stage 7/7: Success. Profile synced to Supabase.")
             else:
                 self.log_to_terminal("⚠️ Scraper returned empty payload. Check for CAPTCHA.")
@@ -255,7 +257,7 @@ class PulseController(MasterpieceView):
             if payload:
                 self.after(0, lambda: self.pipeline_stage_var.set("3 / 7"))
                 self.log_to_terminal("Stage 3/7: Running Identity Resolution...")
-                run_processing_pipeline("scopus", payload)
+                run_processing_pipeline("scopus", payload, payload_path=path)
                 
                 self.after(0, lambda: self.pipeline_stage_var.set("7 / 7"))
                 self.log_to_terminal("Stage 7/7: Scopus Master Sync Success.")
@@ -344,7 +346,7 @@ class PulseController(MasterpieceView):
             self.after(0, self.deiconify)
             
             if payload:
-                run_processing_pipeline("wos", payload)
+                run_processing_pipeline("wos", payload, payload_path=path)
                 if payload.get("papers"):
                     self.log_to_terminal("✅ WoS Master Pipeline Successful.")
                 else:
@@ -0,0 +1,67 @@
+import argparse
+import glob
+import os
+import pandas as pd
+from portable_scraper.core.config import app_config
+from portable_scraper.core.pipeline import run_batch_pipeline, resume_incomplete_runs
+from portable_scraper.core.spool import spool_stats
+
+# Profile / publication file pairs written by each scraper's save phase
+OUTPUT_PATTERNS = [
+    ("scholar", "Scholar_*_Profile.xlsx", "_Exhaustive.xlsx"),
+    ("scopus", "Scopus_*_Profile.xlsx", "_Publications.xlsx"),
+    ("wos", "WoS_*_Profile.xlsx", "_Publications.xlsx"),
+]
+
+def _clean_cell(key, value):
+    """Undoes the Excel round trip: NaN back to None, IDs back to text, 2019.0 back to 2019."""
+    if pd.isna(value):
+        return None
+    if key.endswith("_ID") or key == "ORCID":
+        return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _read_records(path):
+    return [{k: _clean_cell(k, v) for k, v in row.items()} for row in pd.read_excel(path).to_dict("records")]
+
+def load_output_payloads(folder, sources=("scholar", "scopus", "wos")):
+    """
+    Rebuilds (source, payload, path) tuples from a folder of scraper Excel outputs.
+    A profile without a publications file (the scraper found no papers) yields an empty paper list.
+    """
+    payloads = []
+    for source, pattern, papers_suffix in OUTPUT_PATTERNS:
+        if source not in sources:
+            continue
+        for profile_path in sorted(glob.glob(os.path.join(folder, pattern))):
+            profiles = _read_records(profile_path)
+            if not profiles:
+                continue
+            papers_path = profile_path[:-len("_Profile.xlsx")] + papers_suffix
+            papers = _read_records(papers_path) if os.path.exists(papers_path) else []
+            payloads.append((source, {"profile": profiles[0], "papers": papers},
+                             papers_path if papers else profile_path))
+    return payloads
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a folder of scraper Excel outputs through the pipeline as one batch.")
+    parser.add_argument("folder", nargs="?", default=None, help="Folder with the scraper outputs (default: output_folder from config).")
+    parser.add_argument("--source", choices=["scholar", "scopus", "wos"], action="append", help="Limit to a source (repeatable).")
+    parser.add_argument("--no-resume", action="store_true", help="Do not first finish runs an earlier session left incomplete.")
+    args = parser.parse_args()
+
+    if not args.no_resume:
+        resumed = resume_incomplete_runs()
+        if resumed:
+            print(f"♻️ Resumed {sum(resumed.values())}/{len(resumed)} unfinished runs from the spool.")
+
+    folder = args.folder or app_config.output_folder
+    items = load_output_payloads(folder, sources=tuple(args.source or ("scholar", "scopus", "wos")))
+    print(f"📂 {len(items)} payloads found in {folder}")
+    results = run_batch_pipeline(items)
+    for r in results:
+        print(f"{'✅' if r['ok'] else '📦' if r['pending'] else '❌'} [{r['source']}] {r['name']}" + (f" — {r['error']}" if r["error"] else ""))
+    stats = spool_stats()
+    print(f"📦 Spool: {stats['pending']} payloads pending, {stats['failed']} failed, {stats['pending_write_batches']} write batches.")
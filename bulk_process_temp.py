@@ -1,167 +1,80 @@
+import argparse
+import threading
 import time
-from portable_scraper.core.supabase_client import supabase
-from portable_scraper.core.master_linker import run_targeted_linker
-from portable_scraper.core.master_refiner import run_targeted_refiner
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from portable_scraper.core.db import fetch_all
+from portable_scraper.core.bulk_linker import build_staging_jobs, fetch_staging, run_bulk_linker, run_cluster_rebuild
+from portable_scraper.core.master_linker import run_targeted_linker, build_author_index, build_publication_index, AUTHOR_INDEX_COLUMNS
+from portable_scraper.core.master_mirror import sync_master_publications
+from portable_scraper.core.master_refiner import run_bulk_refiner, reclassify_all_publications
 
-def fetch_all(table_name):
-    print(f"Fetching all records from {table_name}...")
-    all_data = []
-    limit = 1000
-    offset = 0
-    while True:
-        res = supabase.table(table_name).select("*").range(offset, offset + limit - 1).execute()
-        if not res.data:
-            break
-        all_data.extend(res.data)
-        if len(res.data) < limit:
-            break
-        offset += limit
-    print(f"Fetched {len(all_data)} records from {table_name}.")
-    return all_data
+def run_link_jobs(jobs, workers=1):
+    """
+    Links (source, label, payload) jobs across a worker pool. Workers share one author
+    index and one publication index; the linker serializes only its write phase on a
+    common lock, so network-bound scoring and hydration overlap. Refinement runs once
+    for all linked authors afterwards (one batched metric sync). A job whose writes
+    failed (insert raised, or any update was rejected) counts as failed and is not
+    refined; its plan never reaches the shared index, so other workers are unaffected.
+    """
+    author_index = build_author_index(fetch_all("master_authors", AUTHOR_INDEX_COLUMNS), ids_loaded=True)
+    pub_index = build_publication_index(sync_master_publications())
+    write_lock = threading.Lock()
 
-def process_scholar():
+    def link_one(source, label, payload):
+        print(f"Running linker for {source} Author: {label}")
+        return run_targeted_linker(payload, source, author_index=author_index, pub_index=pub_index, write_lock=write_lock)
+
+    start = time.time()
+    failed = 0
+    linked = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(link_one, *job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                linked.append(future.result())
+            except Exception as e:
+                failed += 1
+                print(f"❌ Linking failed for {futures[future][1]}: {e}")
+    print(f"Linked {len(jobs) - failed}/{len(jobs)} authors with {workers} workers in {time.time() - start:.1f}s.")
+    run_bulk_refiner(linked)
+
+def process_scholar(workers=1):
     print("\n--- Processing Scholar ---")
-    authors = fetch_all("scholar_authors")
-    papers = fetch_all("scholar_papers")
-    
-    papers_by_id = {}
-    for p in papers:
-        sid = p.get("scholar_id")
-        if sid not in papers_by_id:
-            papers_by_id[sid] = []
-        papers_by_id[sid].append(p)
-        
-    for auth in authors:
-        sid = auth.get("scholar_id")
-        auth_papers = papers_by_id.get(sid, [])
-        
-        # reconstruct payload for linker
-        profile = {
-            "Scholar_ID": sid,
-            "Name": auth.get("name"),
-            "Organization": auth.get("organization"),
-            "Citations": auth.get("total_citations"),
-            "URL": auth.get("profile_url")
-        }
-        
-        papers_payload = []
-        for p in auth_papers:
-            papers_payload.append({
-                "Title": p.get("title"),
-                "Authors": p.get("authors"),
-                "Source": p.get("source"),
-                "Year": p.get("year"),
-                "Volume": p.get("volume"),
-                "Issue": p.get("issue"),
-                "Pages": p.get("pages"),
-                "Description": p.get("description"),
-                "Citations": p.get("citations"),
-                "URL": p.get("url")
-            })
-            
-        payload = {"profile": profile, "papers": papers_payload}
-        print(f"Running linker for Scholar Author: {auth.get('name')}")
-        master_uuid = run_targeted_linker(payload, "scholar")
-        run_targeted_refiner(master_uuid)
+    jobs = build_staging_jobs("scholar", *fetch_staging("scholar"))
+    run_link_jobs(jobs, workers)
 
-def process_scopus():
+def process_scopus(workers=1):
     print("\n--- Processing Scopus ---")
-    authors = fetch_all("scopus_authors")
-    papers = fetch_all("scopus_papers")
-    
-    papers_by_id = {}
-    for p in papers:
-        sid = p.get("scopus_id")
-        if not sid:
-            sid = "NAME:" + str(p.get("author_name"))
-        if sid not in papers_by_id:
-            papers_by_id[sid] = []
-        papers_by_id[sid].append(p)
-        
-    for auth in authors:
-        sid = auth.get("scopus_id")
-        key = sid if sid else "NAME:" + str(auth.get("name"))
-        auth_papers = papers_by_id.get(key, [])
-        
-        profile = {
-            "Scopus_ID": sid,
-            "Name": auth.get("name"),
-            "ORCID": auth.get("orcid"),
-            "Organization": auth.get("organization"),
-            "Documents": auth.get("total_documents"),
-            "H-Index": auth.get("h_index"),
-            "Citations": auth.get("citations")
-        }
-        
-        papers_payload = []
-        for p in auth_papers:
-            papers_payload.append({
-                "Title": p.get("title"),
-                "Authors": p.get("authors"),
-                "Source": p.get("source"),
-                "Year": p.get("year"),
-                "Citations": p.get("citations"),
-                "URL": p.get("url")
-            })
-            
-        payload = {"profile": profile, "papers": papers_payload}
-        print(f"Running linker for Scopus Author: {auth.get('name')}")
-        master_uuid = run_targeted_linker(payload, "scopus")
-        run_targeted_refiner(master_uuid)
+    jobs = build_staging_jobs("scopus", *fetch_staging("scopus"))
+    run_link_jobs(jobs, workers)
 
-def process_wos():
+def process_wos(workers=1):
     print("\n--- Processing Web of Science ---")
-    authors = fetch_all("wos_authors")
-    papers = fetch_all("wos_papers")
-    
-    papers_by_id = {}
-    for p in papers:
-        sid = p.get("wos_id")
-        if not sid:
-            sid = "NAME:" + str(p.get("author_name"))
-        if sid not in papers_by_id:
-            papers_by_id[sid] = []
-        papers_by_id[sid].append(p)
-        
-    for auth in authors:
-        sid = auth.get("wos_id")
-        key = sid if sid else "NAME:" + str(auth.get("name"))
-        auth_papers = papers_by_id.get(key, [])
-        
-        profile = {
-            "WoS_ID": sid,
-            "Name": auth.get("name"),
-            "ORCID": auth.get("orcid"),
-            "Organization": auth.get("organization"),
-            "Sum of Times Cited": auth.get("sum_of_times_cited")
-        }
-        
-        papers_payload = []
-        for p in auth_papers:
-            papers_payload.append({
-                "Title": p.get("title"),
-                "Authors": p.get("authors"),
-                "Source": p.get("source"),
-                "Date/Year": p.get("year"),
-                "Abstract": p.get("abstract"),
-                "Citations": p.get("citations"),
-                "URL": p.get("url"),
-                "Publisher_URL": p.get("publisher_url"),
-                "DOI": p.get("doi"),
-                "Category": p.get("category")
-            })
-            
-        payload = {"profile": profile, "papers": papers_payload}
-        print(f"Running linker for WoS Author: {auth.get('name')}")
-        master_uuid = run_targeted_linker(payload, "wos")
-        run_targeted_refiner(master_uuid)
+    jobs = build_staging_jobs("wos", *fetch_staging("wos"))
+    run_link_jobs(jobs, workers)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk re-link staging tables into the master tables.")
+    parser.add_argument("--workers", type=int, default=1, help="Authors linked concurrently (default: 1).")
+    parser.add_argument("--single-pass", action="store_true", help="Load everything once and link in memory (bulk engine).")
+    parser.add_argument("--cluster", action="store_true", help="Order-independent union-find rebuild from all three staging tables.")
+    parser.add_argument("--dry-run", action="store_true", help="With --cluster: plan only, write nothing (a rebuild after a rebuild should plan 0 changes).")
+    parser.add_argument("--reclassify", action="store_true", help="Only recompute publication_type / source_name / academic_year for every golden paper.")
+    args = parser.parse_args()
+
     print("🚀 Starting Bulk Process of Staging Data to Master Tables...")
     try:
-        process_scholar()
-        process_scopus()
-        process_wos()
+        if args.reclassify:
+            reclassify_all_publications()
+        elif args.cluster:
+            run_cluster_rebuild(refine=not args.dry_run, dry_run=args.dry_run)
+        elif args.single_pass:
+            run_bulk_linker()
+        else:
+            process_scholar(args.workers)
+            process_scopus(args.workers)
+            process_wos(args.workers)
         print("\n✅ Bulk processing complete!")
     except Exception as e:
         print(f"\n❌ Error during processing: {e}")
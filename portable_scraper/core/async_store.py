@@ -0,0 +1,212 @@
+import asyncio
+import contextvars
+import json
+import threading
+import httpx
+from portable_scraper.core.config import app_config as config
+from portable_scraper.core import metrics
+
+# ==========================================
+# 1. SHARED EVENT LOOP + POOLED HTTP CLIENT
+# ==========================================
+# One background event loop owns a single keep-alive httpx.AsyncClient that talks
+# to PostgREST directly ({supabase_url}/rest/v1). A semaphore caps the number of
+# requests in flight, so bursts of chunked writes cannot flood the pool.
+# The Tk thread and the worker threads call the sync wrappers at the bottom,
+# which block on the loop and return plain results.
+_loop = None
+_client = None
+_semaphore = None
+_loop_lock = threading.Lock()
+
+def enabled():
+    """The async layer speaks PostgREST, so it only applies to the Supabase backend."""
+    return getattr(config, "async_storage", True) and getattr(config, "storage_backend", "supabase") == "supabase"
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-store", daemon=True).start()
+    return _loop
+
+def _get_client():
+    """Created lazily on the loop thread so the client and semaphore bind to that loop."""
+    global _client, _semaphore
+    if _client is None:
+        max_conn = getattr(config, "async_max_concurrency", 8)
+        _client = httpx.AsyncClient(
+            base_url=config.supabase_url.rstrip("/") + "/rest/v1",
+            headers={
+                "apikey": config.supabase_key,
+                "Authorization": f"Bearer {config.supabase_key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(max_connections=max_conn, max_keepalive_connections=max_conn),
+            timeout=httpx.Timeout(getattr(config, "async_timeout", 30)),
+        )
+        _semaphore = asyncio.Semaphore(max_conn)
+    return _client
+
+class StoreError(RuntimeError):
+    """Non-2xx PostgREST response. `status` tells transient (5xx/429) from data errors."""
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+# PostgREST / Postgres codes the sync client's APIError carries for a busy or
+# unreachable database: connection errors, resource exhaustion, serialization
+# failures and deadlocks, admin shutdown.
+_TRANSIENT_CODES = {"PGRST000", "PGRST001", "PGRST002", "PGRST003", "40001", "40P01", "57P01", "57P03"}
+_TRANSIENT_CLASSES = ("08", "53")
+
+def is_transient(error):
+    """Network failures and server-side 5xx/429 are worth retrying; 4xx data errors are not."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    status = getattr(error, "status", None)
+    if status is None:
+        # postgrest.APIError (async_storage=False): `code` is the HTTP status when the
+        # body was not JSON (gateway errors), otherwise a PostgREST or SQLSTATE code
+        code = str(getattr(error, "code", None) or "")
+        if code.isdigit() and len(code) == 3:
+            status = int(code)
+        else:
+            return code in _TRANSIENT_CODES or (len(code) == 5 and code[:2] in _TRANSIENT_CLASSES)
+    return status >= 500 or status == 429
+
+# Requests sent on behalf of one run_sync call; credited to the calling thread's metrics span
+_request_box = contextvars.ContextVar("request_box", default=None)
+
+async def _counted(coro, box):
+    _request_box.set(box)  # the task's own context, inherited by gather()'d children
+    return await coro
+
+def run_sync(coro):
+    """Runs `coro` on the shared loop and blocks the calling thread for its result."""
+    box = [0]
+    try:
+        return asyncio.run_coroutine_threadsafe(_counted(coro, box), _get_loop()).result()
+    finally:
+        metrics.note_request(box[0])
+
+# ==========================================
+# 2. POSTGREST FILTER ENCODING
+# ==========================================
+def _pg_value(value):
+    """Quotes a value for in.(...) / cs.{...} lists when it holds reserved characters."""
+    s = str(value)
+    if any(c in s for c in ',.:()"{} \\'):
+        return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return s
+
+def _filter_params(filters):
+    """
+    filters: list of (column, op, value) with op in eq / in / cs,
+    mirroring .eq(), .in_() and .contains() of the sync client.
+    """
+    params = []
+    for column, op, value in filters or []:
+        if op == "in":
+            params.append((column, "in.(" + ",".join(_pg_value(v) for v in value) + ")"))
+        elif op == "cs":
+            params.append((column, "cs.{" + ",".join(_pg_value(v) for v in value) + "}"))
+        else:
+            params.append((column, f"{op}.{value}"))
+    return params
+
+async def _request(method, table, params=None, body=None, prefer=None):
+    client = _get_client()
+    headers = {"Prefer": prefer} if prefer else None
+    content = json.dumps(body, default=str) if body is not None else None
+    box = _request_box.get()
+    if box is not None:
+        box[0] += 1
+    async with _semaphore:
+        res = await client.request(method, "/" + table, params=params, content=content, headers=headers)
+    if res.is_error:
+        # PostgREST puts the useful part (constraint, column, hint) in the body
+        raise StoreError(f"{method} {table} -> {res.status_code}: {res.text[:300]}", res.status_code)
+    return res.json() if res.content else []
+
+# ==========================================
+# 3. ASYNC OPERATIONS
+# ==========================================
+async def aselect(table, columns="*", filters=None):
+    return await _request("GET", table, params=[("select", columns)] + _filter_params(filters))
+
+async def aupsert(table, rows, on_conflict="id"):
+    params = [("on_conflict", on_conflict.replace(" ", ""))]
+    return await _request("POST", table, params=params, body=rows, prefer="resolution=merge-duplicates,return=minimal")
+
+async def ainsert(table, rows):
+    return await _request("POST", table, body=rows, prefer="return=minimal")
+
+async def aselect_in_chunks(table, columns, key, values, chunk_size=100):
+    """Chunked `in_` lookup with every chunk in flight at once."""
+    values = list(values)
+    chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+    pages = await asyncio.gather(*(aselect(table, columns, [(key, "in", c)]) for c in chunks))
+    return [row for page in pages for row in page]
+
+async def _write_bisecting(table, chunk, write, keys, failures):
+    try:
+        await write(chunk)
+        return
+    except Exception as e:
+        if is_transient(e):
+            raise  # bisecting cannot help during an outage; let the caller back off
+        if len(chunk) == 1:
+            print(f"   ❌ {table} row {[chunk[0].get(k) for k in keys]} failed: {e}")
+            failures.append((chunk[0], e))
+            return
+        print(f"   ⚠️ Batch of {len(chunk)} rows into {table} rejected ({e}). Bisecting...")
+    mid = len(chunk) // 2
+    await asyncio.gather(
+        _write_bisecting(table, chunk[:mid], write, keys, failures),
+        _write_bisecting(table, chunk[mid:], write, keys, failures),
+    )
+
+async def awrite_chunks(table, rows, on_conflict=None, chunk_size=500):
+    """
+    Concurrent counterpart of db._write_in_chunks: same grouping by column set and
+    bisection on rejection, but every chunk is sent at once (bounded by the semaphore).
+    `on_conflict=None` inserts, anything else upserts. Returns (row, error) pairs.
+    """
+    if on_conflict:
+        keys = [k.strip() for k in on_conflict.split(",")]
+        write = lambda chunk: aupsert(table, chunk, on_conflict)
+    else:
+        keys = ["id"]
+        write = lambda chunk: ainsert(table, chunk)
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    failures = []
+    await asyncio.gather(*(
+        _write_bisecting(table, group[start:start + chunk_size], write, keys, failures)
+        for group in groups.values()
+        for start in range(0, len(group), chunk_size)
+    ))
+    return failures
+
+# ==========================================
+# 4. SYNC WRAPPERS (Tk thread / worker threads)
+# ==========================================
+def select_many(queries):
+    """
+    Runs independent selects concurrently.
+    queries: list of (table, columns, filters); returns the row lists in the same order.
+    """
+    async def _all():
+        return await asyncio.gather(*(aselect(t, c, f) for t, c, f in queries))
+    return run_sync(_all())
+
+def select_in_chunks(table, columns, key, values, chunk_size=100):
+    return run_sync(aselect_in_chunks(table, columns, key, values, chunk_size))
+
+def write_chunks(table, rows, on_conflict=None, chunk_size=500):
+    return run_sync(awrite_chunks(table, rows, on_conflict, chunk_size))
@@ -0,0 +1,421 @@
+import copy
+import time
+import uuid
+import numpy as np
+from rapidfuzz import fuzz, process
+from portable_scraper.core.config import app_config as config
+from portable_scraper.core.db import fetch_all, bulk_insert, bulk_upsert
+from portable_scraper.core.master_linker import (
+    build_author_index, build_publication_index, build_master_author_record, lookup_master_author,
+    index_author, index_author_ids, plan_paper_links, commit_paper_links, parse_incoming_paper, normalize_doi, normalize_title,
+    build_new_master_paper, build_match_updates, HYDRATE_FIELDS, AUTHOR_INDEX_COLUMNS
+)
+from portable_scraper.core.title_lsh import build_lsh_index, lsh_add, lsh_candidates
+from portable_scraper.core.master_mirror import MIRROR_FIELDS
+from portable_scraper.core.master_refiner import run_bulk_refiner
+
+# ==========================================
+# 1. STAGING ROWS -> LINKER PAYLOADS
+# ==========================================
+# source -> (authors table, papers table, source id column)
+STAGING_TABLES = {
+    "scholar": ("scholar_authors", "scholar_papers", "scholar_id"),
+    "scopus": ("scopus_authors", "scopus_papers", "scopus_id"),
+    "wos": ("wos_authors", "wos_papers", "wos_id"),
+}
+
+# source -> (author columns, paper columns): what the converters below read plus the
+# grouping keys, so bulk pulls skip hashes, keys and unused metrics
+STAGING_COLUMNS = {
+    "scholar": ("scholar_id, name, organization, total_citations, profile_url",
+                "scholar_id, author_name, title, authors, source, year, volume, issue, pages, description, citations, url"),
+    "scopus": ("scopus_id, name, orcid, organization, total_documents, h_index, citations",
+               "scopus_id, author_name, title, authors, source, year, citations, url"),
+    "wos": ("wos_id, name, orcid, organization, sum_of_times_cited",
+            "wos_id, author_name, title, authors, source, year, abstract, citations, url, publisher_url, doi, category"),
+}
+
+def _scholar_profile(auth):
+    return {
+        "Scholar_ID": auth.get("scholar_id"),
+        "Name": auth.get("name"),
+        "Organization": auth.get("organization"),
+        "Citations": auth.get("total_citations"),
+        "URL": auth.get("profile_url")
+    }
+
+def _scholar_paper(p):
+    return {
+        "Title": p.get("title"),
+        "Authors": p.get("authors"),
+        "Source": p.get("source"),
+        "Year": p.get("year"),
+        "Volume": p.get("volume"),
+        "Issue": p.get("issue"),
+        "Pages": p.get("pages"),
+        "Description": p.get("description"),
+        "Citations": p.get("citations"),
+        "URL": p.get("url")
+    }
+
+def _scopus_profile(auth):
+    return {
+        "Scopus_ID": auth.get("scopus_id"),
+        "Name": auth.get("name"),
+        "ORCID": auth.get("orcid"),
+        "Organization": auth.get("organization"),
+        "Documents": auth.get("total_documents"),
+        "H-Index": auth.get("h_index"),
+        "Citations": auth.get("citations")
+    }
+
+def _scopus_paper(p):
+    return {
+        "Title": p.get("title"),
+        "Authors": p.get("authors"),
+        "Source": p.get("source"),
+        "Year": p.get("year"),
+        "Citations": p.get("citations"),
+        "URL": p.get("url")
+    }
+
+def _wos_profile(auth):
+    return {
+        "WoS_ID": auth.get("wos_id"),
+        "Name": auth.get("name"),
+        "ORCID": auth.get("orcid"),
+        "Organization": auth.get("organization"),
+        "Sum of Times Cited": auth.get("sum_of_times_cited")
+    }
+
+def _wos_paper(p):
+    return {
+        "Title": p.get("title"),
+        "Authors": p.get("authors"),
+        "Source": p.get("source"),
+        "Date/Year": p.get("year"),
+        "Abstract": p.get("abstract"),
+        "Citations": p.get("citations"),
+        "URL": p.get("url"),
+        "Publisher_URL": p.get("publisher_url"),
+        "DOI": p.get("doi"),
+        "Category": p.get("category")
+    }
+
+CONVERTERS = {
+    "scholar": (_scholar_profile, _scholar_paper),
+    "scopus": (_scopus_profile, _scopus_paper),
+    "wos": (_wos_profile, _wos_paper),
+}
+
+def staging_author_key(source, row, name_field="name"):
+    """Groups staging papers under their author: source ID, or the name when Scopus/WoS had none."""
+    sid = row.get(STAGING_TABLES[source][2])
+    if source == "scholar" or sid:
+        return sid
+    return "NAME:" + str(row.get(name_field))
+
+def fetch_staging(source):
+    """(authors, papers) staging rows of one source, limited to STAGING_COLUMNS."""
+    authors_table, papers_table, _ = STAGING_TABLES[source]
+    author_columns, paper_columns = STAGING_COLUMNS[source]
+    return fetch_all(authors_table, author_columns), fetch_all(papers_table, paper_columns)
+
+def build_staging_jobs(source, authors, papers):
+    """Rebuilds one (source, name, payload) linker job per staged author."""
+    to_profile, to_paper = CONVERTERS[source]
+
+    papers_by_id = {}
+    for p in papers:
+        papers_by_id.setdefault(staging_author_key(source, p, "author_name"), []).append(p)
+
+    jobs = []
+    for auth in authors:
+        auth_papers = papers_by_id.get(staging_author_key(source, auth), [])
+        payload = {"profile": to_profile(auth), "papers": [to_paper(p) for p in auth_papers]}
+        jobs.append((source, auth.get("name"), payload))
+    return jobs
+
+# ==========================================
+# 2. SINGLE-PASS BULK LINKING ENGINE
+# ==========================================
+def resolve_staged_author(source, profile, author_index, new_authors, author_patches):
+    """In-memory author resolution; records the insert or the merged patch it implies."""
+    m_auth = build_master_author_record(profile, source)
+    master_id = lookup_master_author(author_index, profile, source)
+
+    if master_id is None:
+        master_id = str(uuid.uuid4())
+        new_authors[master_id] = {"id": master_id}
+    (new_authors[master_id] if master_id in new_authors else author_patches.setdefault(master_id, {})).update(m_auth)
+    index_author(author_index, master_id, m_auth["canonical_name"])
+    index_author_ids(author_index, master_id, m_auth)
+    return master_id
+
+def run_bulk_linker(sources=("scholar", "scopus", "wos"), refine=True):
+    """
+    Full re-link without per-author round trips: staging and master tables are loaded
+    once, every author and paper is resolved in memory against shared indexes, and the
+    results go back as batched inserts/upserts. New rows get client-side UUIDs so later
+    authors in the same run can link to them before anything is written.
+    """
+    print("\n" + "="*60)
+    print("🏭 SINGLE-PASS BULK LINKER")
+    print("="*60)
+    t_start = time.time()
+
+    # 1. Load everything once
+    jobs = []
+    for source in sources:
+        jobs.extend(build_staging_jobs(source, *fetch_staging(source)))
+
+    author_index = build_author_index(fetch_all("master_authors", AUTHOR_INDEX_COLUMNS), ids_loaded=True)
+    pub_index = build_publication_index(fetch_all("master_publications", ", ".join(MIRROR_FIELDS + HYDRATE_FIELDS)))
+    t_loaded = time.time()
+
+    # 2. Resolve authors and papers in memory
+    new_authors, author_patches = {}, {}
+    new_papers, paper_patches = {}, {}
+    master_ids = []
+    paper_count = 0
+
+    for source, label, payload in jobs:
+        master_id = resolve_staged_author(source, payload["profile"], author_index, new_authors, author_patches)
+        if master_id not in master_ids: master_ids.append(master_id)
+
+        fresh, pending, row_patches = plan_paper_links(payload["papers"], source, master_id, pub_index)
+        for paper in fresh:
+            paper["id"] = str(uuid.uuid4())
+            for field in HYDRATE_FIELDS: paper.setdefault(field, None) # Nothing to hydrate from the server yet
+            new_papers[paper["id"]] = paper
+        # Everything is written in one pass at the end, so later authors plan against this one's rows
+        commit_paper_links(pub_index, fresh, row_patches)
+        for m_id, patch in pending.items():
+            (new_papers[m_id] if m_id in new_papers else paper_patches.setdefault(m_id, {})).update(patch)
+        paper_count += len(payload["papers"])
+    t_planned = time.time()
+
+    # 3. Batched writes (patches are grouped by column set, so only the columns present are touched)
+    failures = []
+    failures += bulk_insert("master_authors", list(new_authors.values()))
+    failures += bulk_upsert("master_authors", [{"id": m_id, **patch} for m_id, patch in author_patches.items()])
+    failures += bulk_insert("master_publications", list(new_papers.values()))
+    failures += bulk_upsert("master_publications", [{"id": m_id, **patch} for m_id, patch in paper_patches.items()])
+    t_written = time.time()
+
+    if refine:
+        run_bulk_refiner(master_ids)
+    t_end = time.time()
+
+    elapsed = max(t_end - t_start, 1e-9)
+    resolve_time = max(t_planned - t_loaded, 1e-9)
+    stats = {
+        "authors": len(jobs),
+        "master_authors_created": len(new_authors),
+        "master_authors_updated": len(author_patches),
+        "papers": paper_count,
+        "master_papers_created": len(new_papers),
+        "master_papers_updated": len(paper_patches),
+        "failed_rows": len(failures),
+        "load_s": t_loaded - t_start,
+        "resolve_s": t_planned - t_loaded,
+        "write_s": t_written - t_planned,
+        "refine_s": t_end - t_written,
+        "authors_per_s": len(jobs) / elapsed,
+        "papers_per_s": paper_count / elapsed,
+        "resolve_authors_per_s": len(jobs) / resolve_time,
+        "resolve_papers_per_s": paper_count / resolve_time,
+    }
+    print(f"   ✅ BULK LINK COMPLETE: {len(jobs)} authors, {paper_count} papers -> "
+          f"{len(new_papers)} new / {len(paper_patches)} updated golden papers, {len(failures)} failed rows.")
+    print(f"   ⏱️ load {stats['load_s']:.1f}s | resolve {stats['resolve_s']:.1f}s | write {stats['write_s']:.1f}s | refine {stats['refine_s']:.1f}s")
+    print(f"   🚀 {stats['authors_per_s']:.1f} authors/sec, {stats['papers_per_s']:.1f} papers/sec overall "
+          f"({stats['resolve_papers_per_s']:.0f} papers/sec in-memory resolution)")
+    return stats
+
+# ==========================================
+# 3. UNION-FIND CLUSTERING REBUILD
+# ==========================================
+# Deterministic representative order inside a cluster: WoS carries DOIs/abstracts,
+# Scopus clean venues, Scholar the widest coverage.
+SOURCE_PRIORITY = {"wos": 0, "scopus": 1, "scholar": 2}
+
+def _find(parent, x):
+    root = x
+    while parent[root] != root:
+        root = parent[root]
+    while parent[x] != root: # Path compression
+        parent[x], x = root, parent[x]
+    return root
+
+def _union(parent, a, b):
+    ra, rb = _find(parent, a), _find(parent, b)
+    if ra != rb:
+        parent[max(ra, rb)] = min(ra, rb)
+
+def cluster_records(dois, titles, threshold=92, use_lsh=None, chunk_size=256):
+    """
+    Groups records into golden clusters with union-find. Edges are computed once:
+    equal normalized DOI, equal normalized title, and fuzz.ratio > threshold between
+    distinct titles (vectorized cdist, or LSH candidates when enabled).
+    The partition depends only on the edges, never on input order.
+    Returns a list of clusters, each a sorted list of record positions.
+    """
+    n = len(titles)
+    parent = list(range(n))
+
+    first_by_key = {}
+    for i, (doi, title) in enumerate(zip(dois, titles)):
+        for key in (("doi", doi), ("title", title)):
+            if key[1]:
+                _union(parent, i, first_by_key.setdefault(key, i))
+
+    unique = sorted({t for t in titles if t})
+    if use_lsh is None:
+        use_lsh = getattr(config, "linker_lsh", False)
+
+    fuzzy_pairs = []
+    if use_lsh:
+        lsh = build_lsh_index(getattr(config, "lsh_bands", 64), getattr(config, "lsh_rows", 3))
+        for pos, title in enumerate(unique):
+            lsh_add(lsh, pos, title)
+        for i, title in enumerate(unique):
+            for j in lsh_candidates(lsh, title):
+                if j > i and fuzz.ratio(title, unique[j]) > threshold:
+                    fuzzy_pairs.append((i, j))
+    else:
+        for start in range(0, len(unique), chunk_size):
+            scores = process.cdist(unique[start:start + chunk_size], unique, scorer=fuzz.ratio,
+                                   score_cutoff=threshold, workers=getattr(config, "linker_match_workers", -1))
+            for r, j in zip(*np.nonzero(scores > threshold)):
+                if j > start + r:
+                    fuzzy_pairs.append((start + r, int(j)))
+
+    for i, j in fuzzy_pairs:
+        _union(parent, first_by_key[("title", unique[i])], first_by_key[("title", unique[j])])
+
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(_find(parent, i), []).append(i)
+    return list(clusters.values())
+
+def _member_order(member):
+    """Total order on (source, master id, parsed paper) so folding never depends on load order."""
+    source, master_id, f = member
+    return (SOURCE_PRIORITY[source], f["clean_title"], normalize_doi(f["doi"]), str(master_id),
+            f["citations"], sorted((k, str(v)) for k, v in f["raw"].items()))
+
+# Every column _fold_cluster can write (build_new_master_paper / build_match_updates):
+# the rebuild compares against all of them, so an unchanged cluster yields no patch
+CLUSTER_FIELDS = list(dict.fromkeys(
+    MIRROR_FIELDS + HYDRATE_FIELDS
+    + ["academic_year", "department", "wos_category", "publisher_url"]
+    + [f"in_{source}" for source in SOURCE_PRIORITY] + [f"{source}_citations" for source in SOURCE_PRIORITY]
+))
+
+def _fold_cluster(members, base):
+    """Merges staging members (sorted) into `base` using the linker's own merge rules."""
+    golden = base
+    for source, master_id, f in members:
+        if golden is None:
+            golden = build_new_master_paper(f, source, master_id)
+            continue
+        golden.update(build_match_updates(f, golden, source, master_id))
+
+    # Per-source citations: the highest count any member of that source reported
+    for source in SOURCE_PRIORITY:
+        counts = [f["citations"] for src, _, f in members if src == source]
+        if counts: golden[f"{source}_citations"] = max(counts)
+    return golden
+
+def run_cluster_rebuild(sources=("scholar", "scopus", "wos"), refine=True, dry_run=False):
+    """
+    Order-independent bulk rebuild: every staged paper and every existing golden record
+    becomes a node, match edges (DOI equality + fuzzy title) are computed once, and
+    union-find turns the connected components into golden records in a single pass.
+    Clusters holding an existing golden record patch it; clusters holding several are
+    reported as duplicates to merge (nothing is deleted automatically).
+    With `dry_run` nothing is written; a rebuild right after a rebuild must plan
+    0 created / 0 updated papers, which makes it a cheap consistency check.
+    """
+    print("\n" + "="*60)
+    print("🧬 UNION-FIND CLUSTER REBUILD")
+    print("="*60)
+    t_start = time.time()
+
+    # 1. Load everything once and resolve authors in memory
+    jobs = []
+    for source in sources:
+        jobs.extend(build_staging_jobs(source, *fetch_staging(source)))
+    author_index = build_author_index(fetch_all("master_authors", AUTHOR_INDEX_COLUMNS), ids_loaded=True)
+    masters = fetch_all("master_publications", ", ".join(CLUSTER_FIELDS))
+    t_loaded = time.time()
+
+    new_authors, author_patches = {}, {}
+    staged = [] # (source, master author id, parsed paper)
+    for source, label, payload in jobs:
+        master_id = resolve_staged_author(source, payload["profile"], author_index, new_authors, author_patches)
+        staged.extend((source, master_id, f) for f in map(parse_incoming_paper, payload["papers"]) if f["title"])
+
+    # 2. Nodes = existing golden records followed by staged papers
+    dois = [normalize_doi(m.get("doi")) for m in masters] + [normalize_doi(f["doi"]) for _, _, f in staged]
+    titles = [normalize_title(m.get("title")) for m in masters] + [f["clean_title"] for _, _, f in staged]
+    clusters = cluster_records(dois, titles)
+    t_clustered = time.time()
+
+    # 3. One golden record per cluster
+    new_papers, paper_patches, duplicate_groups = [], {}, []
+    for cluster in clusters:
+        existing = sorted((masters[i] for i in cluster if i < len(masters)), key=lambda m: str(m["id"]))
+        members = sorted((staged[i - len(masters)] for i in cluster if i >= len(masters)), key=_member_order)
+        if len(existing) > 1:
+            duplicate_groups.append([m["id"] for m in existing])
+        if not members:
+            continue
+
+        if existing:
+            target = existing[0]
+            golden = _fold_cluster(members, copy.deepcopy(target))
+            known_ids = set(target.get("master_author_ids") or [])
+            patch = {k: v for k, v in golden.items() if k != "master_author_ids" and target.get(k) != v}
+            if set(golden.get("master_author_ids") or []) != known_ids:
+                patch["master_author_ids"] = sorted(set(golden["master_author_ids"]))
+            if patch:
+                paper_patches[target["id"]] = {"title": target.get("title"), **patch}
+        else:
+            golden = _fold_cluster(members, None)
+            golden["master_author_ids"] = sorted(set(golden["master_author_ids"]))
+            golden["id"] = str(uuid.uuid4())
+            new_papers.append(golden)
+    t_planned = time.time()
+
+    # 4. Batched writes
+    failures = []
+    if not dry_run:
+        failures += bulk_insert("master_authors", list(new_authors.values()))
+        failures += bulk_upsert("master_authors", [{"id": m_id, **patch} for m_id, patch in author_patches.items()])
+        failures += bulk_insert("master_publications", new_papers)
+        failures += bulk_upsert("master_publications", [{"id": m_id, **patch} for m_id, patch in paper_patches.items()])
+    t_written = time.time()
+
+    if refine and not dry_run:
+        run_bulk_refiner(list(new_authors) + list(author_patches))
+
+    for group in duplicate_groups:
+        print(f"   ⚠️ Duplicate golden records in one cluster (merge candidates): {group}")
+    stats = {
+        "nodes": len(titles),
+        "clusters": len(clusters),
+        "master_papers_created": len(new_papers),
+        "master_papers_updated": len(paper_patches),
+        "duplicate_groups": duplicate_groups,
+        "failed_rows": len(failures),
+        "load_s": t_loaded - t_start,
+        "cluster_s": t_clustered - t_loaded,
+        "plan_s": t_planned - t_clustered,
+        "write_s": t_written - t_planned,
+    }
+    print(f"   ✅ REBUILD COMPLETE: {len(titles)} nodes -> {len(clusters)} clusters, "
+          f"{len(new_papers)} new / {len(paper_patches)} updated golden papers, {len(failures)} failed rows.")
+    print(f"   ⏱️ load {stats['load_s']:.1f}s | cluster {stats['cluster_s']:.1f}s | plan {stats['plan_s']:.1f}s | write {stats['write_s']:.1f}s")
+    return stats
@@ -5,6 +5,12 @@ from types import SimpleNamespace
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(BASE_DIR, "config.json")
+# Relative folders in the config resolve against the app folder (the .exe's folder
+# when frozen, the project root otherwise), never the current working directory
+APP_DIR = os.path.dirname(sys.executable) if getattr(sys, "frozen", False) else os.path.dirname(os.path.dirname(BASE_DIR))
+
+def resolve_path(path):
+    return path if os.path.isabs(path) else os.path.join(APP_DIR, path)
 
 DEFAULT_CONFIG = {
     "supabase_url": "https://your-url.supabase.co",
@@ -12,7 +18,38 @@ DEFAULT_CONFIG = {
     "login_wait_time": 30,
     "page_load_wait": 10,
     "output_folder": "outputs",
-    "headless": False
+    "headless": False,
+    "linker_batch_matching": True,
+    "linker_match_workers": -1,
+    "db_chunk_size": 500,
+    "linker_update_chunk_size": 500,
+    "cache_folder": "cache",
+    "master_sync_cursor": "updated_at",
+    "master_sync_overlap_minutes": 5,
+    "linker_lsh": False,
+    "lsh_bands": 64,
+    "lsh_rows": 3,
+    "staging_hash_skip": True,
+    "staging_hash_ttl_hours": 24,
+    "async_storage": True,
+    "async_max_concurrency": 8,
+    "async_timeout": 30,
+    "write_queue_max_rows": 500,
+    "write_queue_max_delay": 2.0,
+    "write_queue_backoff_base": 1.0,
+    "write_queue_backoff_max": 60.0,
+    "write_queue_flush_timeout": 120,
+    "write_queue_exit_timeout": 30,
+    "spool_retry_interval": 30,
+    "spool_retry_max": 600,
+    "spool_retention_days": 7,
+    "storage_backend": "supabase",
+    "sqlite_path": "cache/local_store.sqlite3",
+    "pipeline_queue_size": 2,
+    "metrics_folder": "logs",
+    "metrics_export_interval": 15,
+    "metrics_jsonl_max_mb": 10,
+    "fetch_workers": 4
 }
 
 def load_config():
@@ -1,6 +1,14 @@
+import hashlib
+import json
+import os
 import re
+import threading
 import time
-from portable_scraper.core.supabase_client import supabase
+from concurrent.futures import ThreadPoolExecutor
+from portable_scraper.core.config import app_config as config
+from portable_scraper.core.supabase_client import supabase, backend_cache_folder
+from portable_scraper.core import async_store, metrics
+from portable_scraper.core.write_queue import enqueue
 
 
 # ==========================================
@@ -16,17 +24,276 @@ def clean_to_int(value):
         return None
     return int(s)
 
-def retry_db_call(func, max_attempts=3, delay=2):
-    """Universal 3-Attempt Network Resilience Wrapper."""
-    for attempt in range(max_attempts):
+def paper_natural_key(source_id, author_name, title):
+    """
+    Deterministic per-paper key for the staging tables without a natural unique column:
+    sha256 of the owning source ID (or NAME:<author> when the profile had none) and the
+    normalized title. schema_updates.sql backfills existing rows with the same formula.
+    """
+    owner = source_id if source_id else "NAME:" + (author_name or "")
+    clean_title = re.sub(r'[^a-z0-9]', '', str(title or "").lower())
+    return hashlib.sha256(f"{owner}|{clean_title}".encode("utf-8")).hexdigest()
+
+def dedupe_on(rows, keys):
+    """Last row wins per conflict key: Postgres rejects a batch that hits the same row twice."""
+    keys = [k.strip() for k in keys.split(",")] if isinstance(keys, str) else keys
+    return list({tuple(row.get(k) for k in keys): row for row in rows}.values())
+
+def _send_bisecting(table, chunk, send, keys, label, failures):
+    """
+    Sends `chunk`; if it is rejected, splits it in half and retries each side,
+    narrowing down to the offending rows in O(bad * log n) requests instead of
+    one request per row.
+    """
+    try:
+        send(chunk)
+        return
+    except Exception as e:
+        if async_store.is_transient(e):
+            raise  # bisecting cannot help during an outage; let the caller back off
+        if len(chunk) == 1:
+            row = chunk[0]
+            print(f"   ❌ {table} row {[row.get(k) for k in keys]} failed: {e}")
+            failures.append((row, e))
+            return
+        print(f"   ⚠️ Batch {label} of {len(chunk)} rows into {table} rejected ({e}). Bisecting...")
+    mid = len(chunk) // 2
+    _send_bisecting(table, chunk[:mid], send, keys, label, failures)
+    _send_bisecting(table, chunk[mid:], send, keys, label, failures)
+
+def _write_in_chunks(table, rows, send, keys, label, chunk_size=None):
+    """
+    Shared batching for bulk writes. Rows are grouped by column set first, because
+    PostgREST fills the columns a row lacks with NULL for the whole batch.
+    A rejected chunk is bisected so one bad row only loses itself; transient
+    errors (network, 5xx) are raised instead so the caller can back off.
+    Returns a list of (row, error) pairs that could not be written.
+    """
+    chunk_size = chunk_size or getattr(config, "db_chunk_size", 500)
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    failures = []
+    for group in groups.values():
+        for start in range(0, len(group), chunk_size):
+            _send_bisecting(table, group[start:start + chunk_size], send, keys, label, failures)
+    return failures
+
+def bulk_upsert(table, rows, on_conflict="id", chunk_size=None):
+    """Chunked array upsert keyed on `on_conflict`. Returns the (row, error) pairs that failed."""
+    if async_store.enabled():
+        return async_store.write_chunks(table, rows, on_conflict, chunk_size or getattr(config, "db_chunk_size", 500))
+    keys = [k.strip() for k in on_conflict.split(",")]
+    send = lambda chunk: supabase.table(table).upsert(chunk, on_conflict=on_conflict).execute()
+    return _write_in_chunks(table, rows, send, keys, "upsert", chunk_size)
+
+def bulk_insert(table, rows, chunk_size=None):
+    """Chunked array insert. Returns the (row, error) pairs that failed."""
+    if async_store.enabled():
+        return async_store.write_chunks(table, rows, None, chunk_size or getattr(config, "db_chunk_size", 500))
+    send = lambda chunk: supabase.table(table).insert(chunk).execute()
+    return _write_in_chunks(table, rows, send, ["id"], "insert", chunk_size)
+
+# Keyset pagination: every page is `key > last seen key ORDER BY key`, an index range
+# scan whose cost does not grow with the depth of the page (offsets do). When the
+# first page is full, the rest of the key space (up to the largest key) is cut
+# into `workers` ranges paged concurrently; integer and UUID keys can be split,
+# anything else is read as one range. Rows come back ordered by key.
+FETCH_PAGE_SIZE = 1000  # PostgREST's default max-rows; a bigger page would be cut short
+_UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+def _uuid_to_int(value):
+    return int(value.replace("-", ""), 16)
+
+def _int_to_uuid(n):
+    h = f"{n:032x}"
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def _key_ranges(table_name, key, after, workers):
+    """[(after, up to)] ranges covering every key > `after`; `after` exclusive, `up to` inclusive, None = unbounded."""
+    if workers <= 1:
+        return [(after, None)]
+    res = supabase.table(table_name).select(key).order(key, desc=True).limit(1).execute()
+    high = res.data[0][key] if res.data else None
+    if isinstance(after, int) and isinstance(high, int):
+        to_num, from_num = int, int
+    elif isinstance(after, str) and isinstance(high, str) and _UUID_RE.match(after) and _UUID_RE.match(high):
+        to_num, from_num = _uuid_to_int, _int_to_uuid
+    else:
+        return [(after, None)]
+    lo, hi = to_num(after), to_num(high)
+    step = max(1, (hi - lo) // workers + 1)
+    bounds = [after] + [from_num(n) for n in range(lo + step, hi, step)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _fetch_key_range(table_name, columns, key, after=None, up_to=None, max_pages=None):
+    """Pages the keys in (after, up_to]. Returns (rows, pages, full) where full means more rows may follow."""
+    rows, pages = [], 0
+    while max_pages is None or pages < max_pages:
+        query = supabase.table(table_name).select(columns).order(key)
+        if after is not None:
+            query = query.gt(key, after)
+        if up_to is not None:
+            query = query.lte(key, up_to)
+        res = query.limit(FETCH_PAGE_SIZE).execute()
+        pages += 1
+        rows.extend(res.data or [])
+        if not res.data or len(res.data) < FETCH_PAGE_SIZE:
+            return rows, pages, False
+        after = res.data[-1][key]
+    return rows, pages, True
+
+def fetch_all(table_name, columns="*", key="id", workers=None):
+    """
+    Reads a whole table (only `columns`) by keyset pagination on `key`, with up
+    to `workers` key ranges in flight (fetch_workers in the config).
+    """
+    workers = workers or getattr(config, "fetch_workers", 4)
+    wanted = [c.strip() for c in columns.split(",")] if columns.strip() != "*" else None
+    select = columns if wanted is None or key in wanted else f"{columns}, {key}"
+    print(f"Fetching all records from {table_name}...")
+
+    with metrics.span("db.fetch_all", table=table_name) as sp:
+        all_data, _, full = _fetch_key_range(table_name, select, key, max_pages=1)
+        if full:
+            ranges = _key_ranges(table_name, key, all_data[-1][key], workers)
+            if len(ranges) > 1:
+                with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                    parts = list(pool.map(lambda r: _fetch_key_range(table_name, select, key, *r), ranges))
+                sp.add_requests(sum(pages for _, pages, _ in parts))  # worker threads are not traced
+            else:
+                parts = [_fetch_key_range(table_name, select, key, *ranges[0])]
+            for rows, _, _ in parts:
+                all_data.extend(rows)
+        sp.add_items(len(all_data))
+
+    if wanted is not None and key not in wanted:
+        for row in all_data:
+            row.pop(key, None)
+    print(f"Fetched {len(all_data)} records from {table_name}.")
+    return all_data
+
+# ==========================================
+# 1b. CONTENT-HASH CHANGE DETECTION
+# ==========================================
+# Every cleaned staging row carries content_hash = sha256 of its canonical JSON.
+# Hashes of rows we wrote are cached locally (staging_hashes.json in the backend's
+# cache folder) with the time they were last confirmed, so an unchanged re-scrape
+# costs neither a read nor a write. Keys missing from the cache, and cache hits
+# older than staging_hash_ttl_hours, are checked against the content_hash the
+# table holds, so rows edited or deleted server-side are written again.
+_hash_cache = None
+_hash_lock = threading.Lock()
+
+def content_hash(row):
+    body = {k: v for k, v in row.items() if k != "content_hash"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _hash_cache_path():
+    return os.path.join(backend_cache_folder(), "staging_hashes.json")
+
+def _load_hash_cache():
+    global _hash_cache
+    if _hash_cache is None:
         try:
-            return func()
+            with open(_hash_cache_path(), "r", encoding="utf-8") as f:
+                _hash_cache = json.load(f)
+        except (OSError, ValueError):
+            _hash_cache = {}
+    return _hash_cache
+
+def _save_hash_cache():
+    path = _hash_cache_path()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(_hash_cache, f)
+    os.replace(path + ".tmp", path)
+
+def clear_hash_cache(table=None):
+    """Forgets the cached hashes of `table` (or all tables); the next push re-reads them."""
+    with _hash_lock:
+        cache = _load_hash_cache()
+        if table:
+            cache.pop(table, None)
+        else:
+            cache.clear()
+        _save_hash_cache()
+
+def _cached_hash(entry):
+    """(hash, confirmed at). Entries written before timestamps were kept count as expired."""
+    if isinstance(entry, list):
+        return entry[0], entry[1]
+    return entry, 0.0
+
+def _row_key(row, keys):
+    return "|".join(str(row.get(k)) for k in keys)
+
+def _stored_hashes(table, rows, keys, chunk_size=100):
+    """content_hash currently stored for `rows`, filtered on the leading key column."""
+    lead = keys[0]
+    values = list({row.get(lead) for row in rows if row.get(lead) is not None})
+    stored = {}
+    for start in range(0, len(values), chunk_size):
+        res = supabase.table(table).select(", ".join(keys + ["content_hash"]))\
+            .in_(lead, values[start:start + chunk_size]).execute()
+        for r in res.data or []:
+            stored[_row_key(r, keys)] = r.get("content_hash")
+    return stored
+
+def split_unchanged(table, rows, keys):
+    """
+    Stamps each row with its content_hash and returns only the rows that differ
+    from what the table already holds.
+    """
+    for row in rows:
+        row["content_hash"] = content_hash(row)
+    if not getattr(config, "staging_hash_skip", True) or not rows:
+        return rows
+
+    now = time.time()
+    ttl = getattr(config, "staging_hash_ttl_hours", 24) * 3600
+    with _hash_lock:
+        known = _load_hash_cache().setdefault(table, {})
+        # Uncached rows, and rows an expired cache entry would skip, are verified on the server
+        unverified = {}
+        for r in rows:
+            key = _row_key(r, keys)
+            cached, confirmed = _cached_hash(known.get(key))
+            if cached is None or (cached == r["content_hash"] and now - confirmed >= ttl):
+                unverified[key] = r
+    if unverified:
+        try:
+            stored = _stored_hashes(table, list(unverified.values()), keys)
         except Exception as e:
-            if attempt == max_attempts - 1:
-                print(f"   ❌ DB operation failed after {max_attempts} attempts: {e}")
-            else:
-                time.sleep(delay)
-    return None
+            print(f"   ⚠️ Could not read stored hashes for {table} ({e}). Writing the {len(unverified)} unverified rows.")
+            return [r for r in rows if _row_key(r, keys) in unverified or _cached_hash(known.get(_row_key(r, keys)))[0] != r["content_hash"]]
+        with _hash_lock:
+            for key in unverified:
+                if stored.get(key):
+                    known[key] = [stored[key], now]
+                else:
+                    known.pop(key, None)  # not in the table (any more)
+            _save_hash_cache()
+
+    changed = [r for r in rows if _cached_hash(known.get(_row_key(r, keys)))[0] != r["content_hash"]]
+    if len(changed) < len(rows):
+        print(f"   ⏭️ {table}: {len(rows) - len(changed)} unchanged rows skipped, {len(changed)} to write.")
+    return changed
+
+def remember_hashes(table, rows, keys, failures=()):
+    """Records the hashes of rows that were written successfully."""
+    if not rows:
+        return
+    failed = {id(row) for row, _ in failures}
+    now = time.time()
+    with _hash_lock:
+        known = _load_hash_cache().setdefault(table, {})
+        for row in rows:
+            if id(row) not in failed:
+                known[_row_key(row, keys)] = [row["content_hash"], now]
+        _save_hash_cache()
+
 
 # ==========================================
 # 2. SCOPUS (HYBRID UPSERT)
@@ -51,19 +318,17 @@ def push_scopus_payload(payload: dict):
     }
 
     # 1. Smart Author Upsert (Handles missing IDs safely)
-    def handle_scopus_author():
-        if clean_scopus_id:
-            # We have a unique ID, use fast upsert
-            supabase.table("scopus_authors").upsert(profile_clean, on_conflict="scopus_id").execute()
-        else:
-            # Blind insert as fallback
-            supabase.table("scopus_authors").insert(profile_clean).execute()
-    
-    retry_db_call(handle_scopus_author)
+    # We have a unique ID -> upsert on it; otherwise blind insert as fallback.
+    author_keys = ["scopus_id"] if clean_scopus_id else ["name"]
+    if split_unchanged("scopus_authors", [profile_clean], author_keys):
+        enqueue("scopus_authors", [profile_clean], on_conflict="scopus_id" if clean_scopus_id else None,
+                on_written=lambda rows: remember_hashes("scopus_authors", rows, author_keys))
 
-    # 2. Smart Paper Upsert (No Unique Constraints on Table, requires Select check)
+    # 2. Keyed Bulk Paper Upsert (paper_key = source ID/author + normalized title)
+    papers_clean = []
     for p in papers:
-        paper_clean = {
+        papers_clean.append({
+            "paper_key": paper_natural_key(clean_scopus_id, profile_clean["name"], p.get("Title")),
             "scopus_id": clean_scopus_id,
             "author_name": profile_clean["name"],
             "title": p.get("Title"),
@@ -72,20 +337,12 @@ def push_scopus_payload(payload: dict):
             "year": clean_to_int(p.get("Year")),
             "citations": clean_to_int(p.get("Citations")),
             "url": p.get("URL")
-        }
-
-        def handle_scopus_paper():
-            existing = supabase.table("scopus_papers").select("id")\
-                .eq("title", paper_clean["title"])\
-                .eq("author_name", paper_clean["author_name"]).execute()
-            
-            if existing.data:
-                supabase.table("scopus_papers").update(paper_clean).eq("id", existing.data[0]["id"]).execute()
-            else:
-                supabase.table("scopus_papers").insert(paper_clean).execute()
+        })
+
+    changed = split_unchanged("scopus_papers", dedupe_on(papers_clean, "paper_key"), ["paper_key"])
+    enqueue("scopus_papers", changed, on_conflict="paper_key",
+            on_written=lambda rows: remember_hashes("scopus_papers", rows, ["paper_key"]))
 
-        retry_db_call(handle_scopus_paper)
-        
 
 
 
@@ -107,17 +364,22 @@ def push_scholar_payload(payload: dict):
     }
 
     # 1. Author Upsert
-    retry_db_call(lambda: supabase.table("scholar_authors").upsert(profile_clean, on_conflict="scholar_id").execute())
+    if split_unchanged("scholar_authors", [profile_clean], ["scholar_id"]):
+        enqueue("scholar_authors", [profile_clean], on_conflict="scholar_id",
+                on_written=lambda rows: remember_hashes("scholar_authors", rows, ["scholar_id"]))
 
-    # 2. Paper Upsert
+    # 2. Chunked Paper Upsert (one request per chunk, de-duplicated on the conflict key)
+    year_pattern = re.compile(r'\b(19|20)\d{2}\b')
+    papers_clean = []
     for p in papers:
-        paper_clean = {
+        year_match = year_pattern.search(str(p.get("Year", "")))
+        papers_clean.append({
             "scholar_id": profile.get("Scholar_ID"),
             "author_name": profile.get("Name"),
             "title": p.get("Title"),
             "authors": p.get("Authors"),
             "source": p.get("Source"),
-            "year": int(re.search(r'\b(19|20)\d{2}\b', str(p.get("Year", ""))).group(0)) if re.search(r'\b(19|20)\d{2}\b', str(p.get("Year", ""))) else None,
+            "year": int(year_match.group(0)) if year_match else None,
             "volume": p.get("Volume"),
             "issue": p.get("Issue"),
             "pages": p.get("Pages"),
@@ -125,11 +387,12 @@ def push_scholar_payload(payload: dict):
             "description": p.get("Description"),
             "citations": clean_to_int(p.get("Citations")),
             "url": p.get("URL")
-        }
+        })
 
-        retry_db_call(lambda p=paper_clean: supabase.table("scholar_papers").upsert(p, on_conflict="scholar_id, title").execute())
-        
- 
+    paper_keys = ["scholar_id", "title"]
+    changed = split_unchanged("scholar_papers", dedupe_on(papers_clean, paper_keys), paper_keys)
+    enqueue("scholar_papers", changed, on_conflict="scholar_id, title",
+            on_written=lambda rows: remember_hashes("scholar_papers", rows, paper_keys))
 
 # ==========================================
 # 4. WEB OF SCIENCE (HYBRID UPSERT)
@@ -172,17 +435,16 @@ def push_wos_payload(payload: dict):
     }
 
     # 1. Smart Author Upsert
-    def handle_wos_author():
-        if clean_wos_id:
-            supabase.table("wos_authors").upsert(profile_clean, on_conflict="wos_id").execute()
-        else:
-            supabase.table("wos_authors").insert(profile_clean).execute()
-
-    retry_db_call(handle_wos_author)
+    author_keys = ["wos_id"] if clean_wos_id else ["name"]
+    if split_unchanged("wos_authors", [profile_clean], author_keys):
+        enqueue("wos_authors", [profile_clean], on_conflict="wos_id" if clean_wos_id else None,
+                on_written=lambda rows: remember_hashes("wos_authors", rows, author_keys))
 
-    # 2. Smart Paper Upsert
+    # 2. Keyed Bulk Paper Upsert (paper_key = source ID/author + normalized title)
+    papers_clean = []
     for p in papers:
-        paper_clean = {
+        papers_clean.append({
+            "paper_key": paper_natural_key(clean_wos_id, profile_clean["name"], p.get("Title")),
             "wos_id": clean_wos_id,
             "author_name": profile_clean["name"],
             "category": p.get("Category"),
@@ -197,17 +459,8 @@ def push_wos_payload(payload: dict):
             "url": p.get("URL"),
             "publisher_url": p.get("Publisher_URL"),
             "doi": p.get("DOI")
-        }
-
-        def handle_wos_paper():
-            existing = supabase.table("wos_papers").select("id")\
-                .eq("title", paper_clean["title"])\
-                .eq("author_name", paper_clean["author_name"]).execute()
-                
-            if existing.data:
-                supabase.table("wos_papers").update(paper_clean).eq("id", existing.data[0]["id"]).execute()
-            else:
-                supabase.table("wos_papers").insert(paper_clean).execute()
-        
-        retry_db_call(handle_wos_paper)
-        
+        })
+
+    changed = split_unchanged("wos_papers", dedupe_on(papers_clean, "paper_key"), ["paper_key"])
+    enqueue("wos_papers", changed, on_conflict="paper_key",
+            on_written=lambda rows: remember_hashes("wos_papers", rows, ["paper_key"]))
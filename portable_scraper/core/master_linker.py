@@ -1,7 +1,14 @@
 import re
-from rapidfuzz import fuzz
+import time
+import uuid
+from contextlib import nullcontext
+from rapidfuzz import fuzz, process
+from portable_scraper.core.config import app_config as config
 from portable_scraper.core.supabase_client import supabase
-from portable_scraper.core.db import clean_to_int
+from portable_scraper.core.db import clean_to_int, bulk_upsert
+from portable_scraper.core import async_store, metrics
+from portable_scraper.core.master_mirror import sync_master_publications
+from portable_scraper.core.title_lsh import build_lsh_index, lsh_add, lsh_candidates
 
 def clean_author_name(name):
     if not name: return ""
@@ -10,84 +17,123 @@ def clean_author_name(name):
     name = re.sub(r'[^a-z\s]', ' ', name)
     return " ".join(name.split())
 
-def resolve_master_author(profile_data, source):
-    """Identifies or creates the Master Author via Waterfall check."""
-    existing_id = None
-    
-    # 1. Map the incoming source ID to the correct database column
-    id_mapping = {
-        "scholar": ("scholar_id", profile_data.get("Scholar_ID")),
-        "scopus": ("scopus_id", profile_data.get("Scopus_ID")),
-        "wos": ("wos_id", profile_data.get("WoS_ID"))
-    }
-    
-    check_field, check_val = id_mapping.get(source, (None, None))
-    
-    if check_val:
-        res = supabase.table("master_authors").select("id").eq(check_field, check_val).execute()
-        if res.data:
-            existing_id = res.data[0]['id']
+# ==========================================
+# AUTHOR BLOCKING INDEX
+# ==========================================
+def author_block_keys(clean_name):
+    """
+    Blocking keys for a cleaned author name. Two names can only score above the
+    fuzzy threshold (or pass the initials override) if they share at least one key:
+      tok:<token>   - every full token longer than one letter ("baby", "chaitanya")
+      pre:<prefix>  - 4-letter prefix of longer tokens (survives typos / "venkataramana")
+      ini:<letters> - sorted first letters of all tokens ("v baby" == "baby vadlana" -> "bv")
+    """
+    tokens = clean_name.split()
+    if not tokens: return set()
+    keys = {f"tok:{t}" for t in tokens if len(t) > 1}
+    keys.update(f"pre:{t[:4]}" for t in tokens if len(t) >= 4)
+    keys.add("ini:" + "".join(sorted(t[0] for t in tokens)))
+    return keys
 
-    # 2. Fallback to ORCID if exists
-    if not existing_id and profile_data.get("ORCID"):
-        res = supabase.table("master_authors").select("id").eq("orcid", profile_data["ORCID"]).execute()
-        if res.data:
-            existing_id = res.data[0]['id']
+def build_author_index(authors, ids_loaded=False):
+    """
+    Builds an in-memory blocking index over master_authors rows (id, canonical_name).
+    Source IDs / ORCID the rows carry are hashed for the in-memory waterfall; pass
+    `ids_loaded=True` when the rows were read with AUTHOR_INDEX_COLUMNS, so that
+    resolve_master_author answers the whole waterfall without queries.
+    """
+    authors = list(authors or [])
+    index = {"names": {}, "blocks": {}, "ids": {}, "ids_loaded": ids_loaded}
+    for author in authors:
+        index_author(index, author["id"], author.get("canonical_name"))
+        index_author_ids(index, author["id"], author)
+    return index
 
-    incoming_name = profile_data.get("Name") or profile_data.get("name")
-            
-    # 3. Robust Fuzzy Name Matching Fallback
-    if not existing_id and incoming_name:
-        clean_inc = clean_author_name(incoming_name)
-        
-        all_authors_res = supabase.table("master_authors").select("id, canonical_name").execute()
-        all_authors = all_authors_res.data if all_authors_res else []
-        
-        best_match_id = None
-        best_score = 0
-        
-        for author in all_authors:
-            current_name = author.get("canonical_name", "")
-            clean_curr = clean_author_name(current_name)
-            
-            # Use token_sort_ratio to ignore word order (e.g. Baby Vadlana == Vadlana Baby)
-            score = fuzz.token_sort_ratio(clean_inc, clean_curr)
-            
-            # --- INTELLIGENT INITIALS OVERRIDE ---
-            # Catches variations like "v baby" vs "baby vadlana" or "t s k chaitanya" vs "t sri krishna chaitanya"
-            if score < 85:
-                parts_inc = set(clean_inc.split())
-                parts_curr = set(clean_curr.split())
-                common = parts_inc.intersection(parts_curr)
-                
-                # If they share at least one exact string (like "baby" or "chaitanya")
-                if common:
-                    rem_inc = list(parts_inc - common)
-                    rem_curr = list(parts_curr - common)
-                    
-                    if len(rem_inc) == len(rem_curr) and len(rem_inc) > 0:
-                        rem_inc.sort()
-                        rem_curr.sort()
-                        # Verify that every remaining pair is a valid Initial-to-Word mapping
-                        all_match = True
-                        for w1, w2 in zip(rem_inc, rem_curr):
-                            if not ((len(w1) == 1 and w2.startswith(w1)) or (len(w2) == 1 and w1.startswith(w2))):
-                                all_match = False
-                                break
-                        if all_match:
-                            score = 100
-                            print(f"   🧠 Smart Multi-Initial Bypass triggered for '{clean_inc}' <-> '{clean_curr}'")
-
-            if score > best_score and score > 85: # High confidence threshold
-                best_score = score
-                best_match_id = author["id"]
-                
-        if best_match_id:
-            existing_id = best_match_id
-            print(f"   ♻️ Fuzzy Name Match Found: [{incoming_name}] resolved to Master UUID [{existing_id}] with score {best_score}%")
+AUTHOR_ID_FIELDS = ["scholar_id", "scopus_id", "wos_id", "orcid"]
+# What build_author_index needs from master_authors for the in-memory waterfall
+AUTHOR_INDEX_COLUMNS = ", ".join(["id", "canonical_name"] + AUTHOR_ID_FIELDS)
+
+def index_author_ids(index, author_id, record):
+    for field in AUTHOR_ID_FIELDS:
+        if record.get(field):
+            index["ids"][(field, record[field])] = author_id
+
+def index_author(index, author_id, canonical_name):
+    """Adds (or re-keys, when the canonical name changed) a single author in the index."""
+    clean_name = clean_author_name(canonical_name)
+    old = index["names"].get(author_id)
+    if old is not None:
+        if old[1] == clean_name: return
+        for key in author_block_keys(old[1]):
+            index["blocks"].get(key, set()).discard(author_id)
+    seq = old[0] if old is not None else len(index["names"])
+    index["names"][author_id] = (seq, clean_name)
+    for key in author_block_keys(clean_name):
+        index["blocks"].setdefault(key, set()).add(author_id)
+
+def author_candidates(index, clean_name):
+    """Returns (author_id, clean_name) pairs sharing a block with the name, in table order."""
+    ids = set()
+    for key in author_block_keys(clean_name):
+        ids.update(index["blocks"].get(key, ()))
+    names = index["names"]
+    return [(a_id, names[a_id][1]) for a_id in sorted(ids, key=lambda a_id: names[a_id][0])]
+
+def score_author_names(clean_inc, clean_curr):
+    """Fuzzy name score with the multi-initial override (100 when initials line up)."""
+    # Use token_sort_ratio to ignore word order (e.g. Baby Vadlana == Vadlana Baby)
+    score = fuzz.token_sort_ratio(clean_inc, clean_curr)
+
+    # --- INTELLIGENT INITIALS OVERRIDE ---
+    # Catches variations like "v baby" vs "baby vadlana" or "t s k chaitanya" vs "t sri krishna chaitanya"
+    if score < 85:
+        parts_inc = set(clean_inc.split())
+        parts_curr = set(clean_curr.split())
+        common = parts_inc.intersection(parts_curr)
+
+        # If they share at least one exact string (like "baby" or "chaitanya")
+        if common:
+            rem_inc = list(parts_inc - common)
+            rem_curr = list(parts_curr - common)
+
+            if len(rem_inc) == len(rem_curr) and len(rem_inc) > 0:
+                rem_inc.sort()
+                rem_curr.sort()
+                # Verify that every remaining pair is a valid Initial-to-Word mapping
+                all_match = True
+                for w1, w2 in zip(rem_inc, rem_curr):
+                    if not ((len(w1) == 1 and w2.startswith(w1)) or (len(w2) == 1 and w1.startswith(w2))):
+                        all_match = False
+                        break
+                if all_match:
+                    score = 100
+                    print(f"   🧠 Smart Multi-Initial Bypass triggered for '{clean_inc}' <-> '{clean_curr}'")
+    return score
+
+def fuzzy_resolve_author(index, incoming_name):
+    """Scores only the blocked candidates. Returns (master_id, score) or (None, 0)."""
+    clean_inc = clean_author_name(incoming_name)
+    best_match_id = None
+    best_score = 0
+
+    for author_id, clean_curr in author_candidates(index, clean_inc):
+        score = score_author_names(clean_inc, clean_curr)
+        if score > best_score and score > 85: # High confidence threshold
+            best_score = score
+            best_match_id = author_id
+    return best_match_id, best_score
+
+# Incoming source -> (master_authors column, scraper profile key)
+SOURCE_ID_KEYS = {
+    "scholar": ("scholar_id", "Scholar_ID"),
+    "scopus": ("scopus_id", "Scopus_ID"),
+    "wos": ("wos_id", "WoS_ID")
+}
 
+def build_master_author_record(profile_data, source):
+    """The master_authors patch a scraped profile contributes."""
     m_auth = {
-        "canonical_name": incoming_name,
+        "canonical_name": profile_data.get("Name") or profile_data.get("name"),
         "department": "CSE", 
         "preferred_organization": profile_data.get("Organization") or profile_data.get("affiliation") or "VNR VJIET",
     }
@@ -96,7 +142,7 @@ def resolve_master_author(profile_data, source):
     if profile_data.get("ORCID"):
         m_auth["orcid"] = profile_data.get("ORCID")
     
-    # 4. Map the specific ID and metrics based on the source we just scraped
+    # Map the specific ID and metrics based on the source we just scraped
     if source == "scholar":
         if profile_data.get("Scholar_ID"): m_auth["scholar_id"] = profile_data.get("Scholar_ID")
         m_auth["scholar_citations"] = clean_to_int(profile_data.get("Citations"))
@@ -106,137 +152,536 @@ def resolve_master_author(profile_data, source):
     elif source == "wos":
         if profile_data.get("WoS_ID"): m_auth["wos_id"] = profile_data.get("WoS_ID")
         m_auth["wos_citations"] = clean_to_int(profile_data.get("Sum of Times Cited"))
+    return m_auth
+
+def lookup_master_author(index, profile_data, source):
+    """In-memory waterfall (source ID -> ORCID -> fuzzy name) against a fully loaded author index."""
+    check_field, profile_key = SOURCE_ID_KEYS.get(source, (None, None))
+    check_val = profile_data.get(profile_key) if profile_key else None
+    if check_val and (check_field, check_val) in index["ids"]:
+        return index["ids"][(check_field, check_val)]
+    if profile_data.get("ORCID") and ("orcid", profile_data["ORCID"]) in index["ids"]:
+        return index["ids"][("orcid", profile_data["ORCID"])]
+
+    incoming_name = profile_data.get("Name") or profile_data.get("name")
+    if incoming_name:
+        best_match_id, best_score = fuzzy_resolve_author(index, incoming_name)
+        if best_match_id:
+            print(f"   ♻️ Fuzzy Name Match Found: [{incoming_name}] resolved to Master UUID [{best_match_id}] with score {best_score}%")
+            return best_match_id
+    return None
+
+def resolve_master_author(profile_data, source, author_index=None, dry_run=False):
+    """
+    Identifies or creates the Master Author via Waterfall check.
+    Pass a prebuilt `author_index` to reuse it across calls; it is kept in sync
+    with any rename or insert made here.
+    With `dry_run` nothing is written and a diff {"action", "id", "record"} is returned
+    instead of the id; a dry run given an `author_index` resolves fully in memory (offline),
+    and a planned insert gets a "dry-run:" placeholder id so chained runs can link to it.
+    An index that was not loaded with the ID columns cannot tell a new author from one it
+    never saw: a miss there is reported as action "unknown" with an "unknown:" placeholder.
+    """
+    if dry_run and author_index is not None:
+        existing_id = lookup_master_author(author_index, profile_data, source)
+        m_auth = build_master_author_record(profile_data, source)
+        if existing_id and not existing_id.startswith("unknown:"):
+            action = "update"
+        elif existing_id or not author_index.get("ids_loaded"):
+            action = "unknown"
+        else:
+            action = "insert"
+        master_id = existing_id or f"{'unknown' if action == 'unknown' else 'dry-run'}:{uuid.uuid4()}"
+        index_author(author_index, master_id, m_auth["canonical_name"])
+        index_author_ids(author_index, master_id, m_auth)
+        return {"action": action, "id": master_id, "record": m_auth}
+
+    existing_id = None
+    incoming_name = profile_data.get("Name") or profile_data.get("name")
+    # A fully loaded index (kept in sync below) answers the whole waterfall without queries
+    indexed = author_index is not None and author_index.get("ids_loaded")
+    if indexed:
+        existing_id = lookup_master_author(author_index, profile_data, source)
+    
+    # 1. Map the incoming source ID to the correct database column
+    check_field, profile_key = SOURCE_ID_KEYS.get(source, (None, None))
+    check_val = profile_data.get(profile_key) if profile_key else None
+    
+    if check_val and not indexed:
+        res = supabase.table("master_authors").select("id").eq(check_field, check_val).execute()
+        if res.data:
+            existing_id = res.data[0]['id']
+
+    # 2. Fallback to ORCID if exists
+    if not existing_id and not indexed and profile_data.get("ORCID"):
+        res = supabase.table("master_authors").select("id").eq("orcid", profile_data["ORCID"]).execute()
+        if res.data:
+            existing_id = res.data[0]['id']
+
+    # 3. Robust Fuzzy Name Matching Fallback (scored against blocked candidates only)
+    if not existing_id and not indexed and incoming_name:
+        if author_index is None:
+            all_authors_res = supabase.table("master_authors").select("id, canonical_name").execute()
+            author_index = build_author_index(all_authors_res.data if all_authors_res else [])
+
+        best_match_id, best_score = fuzzy_resolve_author(author_index, incoming_name)
+                
+        if best_match_id:
+            existing_id = best_match_id
+            print(f"   ♻️ Fuzzy Name Match Found: [{incoming_name}] resolved to Master UUID [{existing_id}] with score {best_score}%")
+
+    # 4. Build the patch for the source we just scraped
+    m_auth = build_master_author_record(profile_data, source)
+
+    if dry_run:
+        return {"action": "update" if existing_id else "insert", "id": existing_id or f"dry-run:{uuid.uuid4()}", "record": m_auth}
         
     if existing_id:
         print(f"   ♻️  Match Found via {source}. Updating Master UUID: {existing_id}")
         # 🟢 THE FIX: Use .update(eq()) instead of .upsert()! 
         # Upsert in python postgrest replaces the ENTIRE row, deleting other IDs. Update guarantees a safe patch.
         supabase.table("master_authors").update(m_auth).eq("id", existing_id).execute()
-        return existing_id
+        master_id = existing_id
     else:
         print(f"   🆕 No match found. Creating a fresh Golden Record for {m_auth['canonical_name']}.")
         res = supabase.table("master_authors").insert(m_auth).execute()
-        return res.data[0]['id']
+        master_id = res.data[0]['id']
 
-def run_targeted_linker(payload: dict, source: str):
-    print("\n" + "="*60)
-    print(f"🧠 STARTING IDENTITY RESOLUTION ({source.upper()})")
-    print("="*60)
+    if author_index is not None:
+        index_author(author_index, master_id, incoming_name)
+        index_author_ids(author_index, master_id, m_auth)
+    return master_id
 
-    profile = payload["profile"]
-    papers = payload["papers"]
+# ==========================================
+# PUBLICATION INDEX
+# ==========================================
+def normalize_doi(doi):
+    return str(doi).strip().lower() if doi else ""
 
-    # 1. Resolve the Master Author
-    master_uuid = resolve_master_author(profile, source)
+def normalize_title(title):
+    return re.sub(r'[^a-z0-9]', '', str(title or "").lower())
+
+def build_publication_index(rows, use_lsh=None):
+    """
+    Hashes master_publications once per run: exact DOI and exact normalized-title
+    lookups are O(1), and every stored title is normalized only once for fuzzy scoring.
+    With `use_lsh` (default: config.linker_lsh) a MinHash/LSH candidate generator
+    restricts fuzzy scoring to titles sharing a band with the query.
+    """
+    index = {"by_doi": {}, "by_title": {}, "titles": [], "rows": []}
+    if use_lsh is None:
+        use_lsh = getattr(config, "linker_lsh", False)
+    if use_lsh:
+        index["lsh"] = build_lsh_index(getattr(config, "lsh_bands", 64), getattr(config, "lsh_rows", 3))
+    for row in rows or []:
+        index_publication(index, row)
+    return index
+
+def index_publication(index, row):
+    """Registers a (new or freshly updated) master row so later lookups in the run see it."""
+    doi = normalize_doi(row.get("doi"))
+    clean_title = normalize_title(row.get("title"))
+    if doi: index["by_doi"].setdefault(doi, row)
+    if clean_title: index["by_title"].setdefault(clean_title, row)
+    if "lsh" in index: lsh_add(index["lsh"], len(index["rows"]), clean_title)
+    index["titles"].append(clean_title)
+    index["rows"].append(row)
+
+def find_master_match(index, doi, clean_title, batch_hit=None, fuzzy_from=0, fuzzy_to=None):
+    """
+    DOI hit -> exact title hit -> fuzzy title score above 92. Returns the row or None.
+    In batched mode `batch_hit` carries the precomputed best fuzzy match and `fuzzy_from`
+    limits the per-pair scan to rows indexed after the batch was scored; `fuzzy_to`
+    caps it (unlocked callers pass their snapshot so they never chase concurrent appends).
+    """
+    doi = normalize_doi(doi)
+    if doi and doi in index["by_doi"]:
+        return index["by_doi"][doi]
+    if not clean_title:
+        return None
+    if clean_title in index["by_title"]:
+        return index["by_title"][clean_title]
+
+    if batch_hit is not None:
+        return batch_hit
+
+    # Only misses pay for fuzzy scoring (and, with LSH, only against their candidates)
+    titles, rows = index["titles"], index["rows"]
+    # index_publication may be appending on another thread: never read past either list
+    end = min(len(titles), len(rows), fuzzy_to if fuzzy_to is not None else len(titles))
+    if "lsh" in index:
+        positions = sorted(i for i in lsh_candidates(index["lsh"], clean_title) if fuzzy_from <= i < end)
+    else:
+        positions = range(fuzzy_from, end)
+    for i in positions:
+        if titles[i] and fuzz.ratio(clean_title, titles[i]) > 92: # Aggressive matching score to catch trailing periods or typos
+            return rows[i]
+    return None
+
+def match_titles_batch(index, clean_titles, workers=-1, chunk_size=256, limit=None):
+    """
+    Scores every incoming title against every indexed title with one vectorized
+    rapidfuzz cdist per chunk and returns the BEST row above 92 per title (or None).
+    Chunking bounds the score matrix to chunk_size x len(index) floats.
+    `limit` pins the scan to the first N rows, i.e. a snapshot other threads may append past.
+    """
+    limit = len(index["rows"]) if limit is None else limit
+    choices, rows = index["titles"][:limit], index["rows"][:limit]
+    hits = [None] * len(clean_titles)
+    if not choices: return hits
+
+    if "lsh" in index:
+        # Sub-linear path: score each title only against its LSH candidates
+        for qi, query in enumerate(clean_titles):
+            if not query: continue
+            cands = sorted(c for c in lsh_candidates(index["lsh"], query) if c < limit)
+            best = process.extractOne(query, [choices[c] for c in cands], scorer=fuzz.ratio, score_cutoff=92)
+            if best and best[1] > 92:
+                hits[qi] = rows[cands[best[2]]]
+        return hits
+
+    for start in range(0, len(clean_titles), chunk_size):
+        chunk = clean_titles[start:start + chunk_size]
+        scores = process.cdist(chunk, choices, scorer=fuzz.ratio, score_cutoff=92, workers=workers)
+        best = scores.argmax(axis=1)
+        for offset, j in enumerate(best):
+            if chunk[offset] and choices[j] and scores[offset, j] > 92:
+                hits[start + offset] = rows[j]
+    return hits
+
+def parse_incoming_paper(p):
+    """Normalizes one scraper/staging paper dict into the fields the linker works with."""
+    title = str(p.get("Title", p.get("title", "")) or "").strip()
+
+    c_raw = str(p.get("Citations", p.get("citations", p.get("Times Cited", 0))))
+    year_raw = str(p.get("Year", p.get("year", p.get("Date/Year", p.get("date", 0)))))
+    _year_match = re.search(r'\b(19|20)\d{2}\b', year_raw)
+
+    vol = p.get("Volume", p.get("volume", ""))
+    iss = p.get("Issue", p.get("issue", ""))
+    pgs = p.get("Pages", p.get("pages", ""))
+
+    return {
+        "raw": p,
+        "title": title,
+        "clean_title": normalize_title(title),
+        "doi": p.get("DOI", p.get("doi")),
+        "citations": int(re.sub(r"[^\d]", "", c_raw) or 0),
+        "year": int(_year_match.group(0)) if _year_match else 0,
+        "source_name": p.get("Source", p.get("source", p.get("journal", ""))),
+        "authors_list": p.get("Authors", p.get("authors", "")),
+        "abstract": p.get("Abstract", p.get("abstract", p.get("description", ""))),
+        "paper_url": p.get("Link", p.get("link", p.get("URL", p.get("url", p.get("paper_url", ""))))),
+        "vol_str": f"Vol: {vol}, Iss: {iss}, Pgs: {pgs}" if (vol or iss or pgs) else "",
+    }
 
-    # 2. Fetch EXISTING Master Papers globally for True Cross-Author Deduplication
-    existing_master = supabase.table("master_publications").select("*").execute().data
+# Columns the merge step inspects that the key mirror does not carry
+HYDRATE_FIELDS = ["abstract", "publication_year", "source_name", "authors_list", "volume_issue_pages", "paper_url"]
+
+def fetch_hydration(rows, chunk_size=100):
+    """
+    Fetches the merge columns for matched master rows only (chunked `in_` on id).
+    Read-only: returns {id: {field: value}} and leaves the (possibly shared) rows alone.
+    """
+    ids = list({row["id"] for row in rows if "id" in row and any(f not in row for f in HYDRATE_FIELDS)})
+    if not ids:
+        return {}
+    columns = ", ".join(["id"] + HYDRATE_FIELDS)
+    if async_store.enabled():
+        fetched = async_store.select_in_chunks("master_publications", columns, "id", ids, chunk_size)
+    else:
+        fetched = []
+        for start in range(0, len(ids), chunk_size):
+            res = supabase.table("master_publications").select(columns)\
+                .in_("id", ids[start:start + chunk_size]).execute()
+            fetched.extend(res.data or [])
+    return {full["id"]: {f: full.get(f) for f in HYDRATE_FIELDS} for full in fetched}
+
+def hydrate_master_rows(rows, chunk_size=100, fetched=None):
+    """
+    Fills the merge columns of matched rows in place, using `fetched` (a prior
+    fetch_hydration result) first and querying only for what is still missing.
+    Mutates shared index rows, so concurrent callers must hold the write lock.
+    """
+    fetched = dict(fetched or {})
+    pending = [row for row in rows if "id" in row and any(f not in row for f in HYDRATE_FIELDS) and row["id"] not in fetched]
+    fetched.update(fetch_hydration(pending, chunk_size))
+    for row in rows:
+        fields = fetched.get(row.get("id"))
+        if fields:
+            for f, value in fields.items():
+                row.setdefault(f, value)
+
+def build_new_master_paper(f, source, master_uuid):
+    year = f["year"]
+    p = f["raw"]
+    new_paper = {
+        "master_author_ids": [master_uuid], 
+        "title": f["title"], 
+        "doi": f["doi"],
+        "publication_year": year, 
+        "source_name": f["source_name"],
+        "authors_list": f["authors_list"], 
+        "abstract": f["abstract"],
+        "paper_url": f["paper_url"],
+        f"in_{source}": True, 
+        f"{source}_citations": f["citations"],
+        "academic_year": f"{year}-{year+1}" if 1900 <= year <= 2099 else "N/A",
+        "department": "CSE"
+    }
+    if source == "scholar":
+        new_paper["volume_issue_pages"] = f"Vol: {p.get('Volume', '')}, Iss: {p.get('Issue', '')}, Pgs: {p.get('Pages', '')}"
+    elif source == "wos":
+        new_paper["wos_category"] = p.get("Category")
+        new_paper["publisher_url"] = p.get("Publisher_URL")
+    return new_paper
+
+def build_match_updates(f, match, source, master_uuid, loaded_only=False):
+    """
+    Patch for an existing golden record: new source flags plus any fields it is missing.
+    With `loaded_only` (offline dry runs, where matched rows are not hydrated) a field
+    only counts as missing when the row actually carries it, and an unresolved
+    "unknown:" author is not appended.
+    """
+    p = f["raw"]
+    updates = {
+        f"in_{source}": True, 
+        f"{source}_citations": f["citations"]
+    }
+    missing = lambda key: (key in match or not loaded_only) and not match.get(key)
     
-    new_master_papers = []
-    updated_count = 0
+    # --- THE ARRAY APPEND LOGIC ---
+    # Extract the active array, append new UUID if missing, and push it back!
+    current_ids = match.get("master_author_ids") or []
+    if master_uuid not in current_ids and not (loaded_only and str(master_uuid).startswith("unknown:")):
+        current_ids = current_ids + [master_uuid]  # new list: an earlier patch may still hold the old one
+        match["master_author_ids"] = current_ids
+        updates["master_author_ids"] = current_ids
+    if missing("doi") and f["doi"]: updates["doi"] = f["doi"]
+    if missing("abstract") and f["abstract"]: updates["abstract"] = f["abstract"]
+    year = f["year"]
+    stored_year = match.get("publication_year")
+    if year and (missing("publication_year") or (stored_year is not None and not 1900 <= stored_year <= 2099)): updates["publication_year"] = year
+    if missing("source_name") and f["source_name"]: updates["source_name"] = f["source_name"]
+    if missing("authors_list") and f["authors_list"]: updates["authors_list"] = f["authors_list"]
+    if missing("volume_issue_pages") and f["vol_str"]: updates["volume_issue_pages"] = f["vol_str"]
+    if missing("paper_url") and f["paper_url"]: updates["paper_url"] = f["paper_url"]
+    
+    if source == "wos":
+        if p.get("Category"): updates["wos_category"] = p.get("Category")
+        if p.get("Publisher_URL"): updates["publisher_url"] = p.get("Publisher_URL")
+    return updates
 
-    print(f"   🔎 Cross-referencing {len(papers)} incoming papers against {len(existing_master)} existing master records...")
+def _add_time(timings, key, started):
+    if timings is not None:
+        timings[key] = timings.get(key, 0.0) + time.perf_counter() - started
 
-    # 3. Deduplicate and Merge
-    for p in papers:
-        title = p.get("Title", p.get("title", "")).strip()
-        if not title: continue
-        
-        doi = p.get("DOI", p.get("doi"))
-        c_raw = str(p.get("Citations", p.get("citations", p.get("Times Cited", 0))))
-        citations = int(re.sub(r"[^\d]", "", c_raw) or 0)
-        
-        year_raw = str(p.get("Year", p.get("year", p.get("Date/Year", p.get("date", 0)))))
-        _year_match = re.search(r'\b(19|20)\d{2}\b', year_raw)
-        year = int(_year_match.group(0)) if _year_match else 0
-        
-        source_name = p.get("Source", p.get("source", p.get("journal", "")))
-        authors_list = p.get("Authors", p.get("authors", ""))
-        abstract_txt = p.get("Abstract", p.get("abstract", p.get("description", "")))
-        paper_url = p.get("Link", p.get("link", p.get("URL", p.get("url", p.get("paper_url", "")))))
-        
-        vol = p.get("Volume", p.get("volume", ""))
-        iss = p.get("Issue", p.get("issue", ""))
-        pgs = p.get("Pages", p.get("pages", ""))
-        vol_str = f"Vol: {vol}, Iss: {iss}, Pgs: {pgs}" if (vol or iss or pgs) else ""
-        
-        clean_inc_title = re.sub(r'[^a-z0-9]', '', title.lower())
-        
-        match = None
-        for mp in existing_master:
-            # Check hard DOI matching
-            if doi and mp.get("doi") and str(doi).strip().lower() == str(mp.get("doi")).strip().lower():
-                match = mp
-                break
-            
-            # Check rigorous Title string matching
-            curr_title = str(mp.get("title") or "")
-            clean_curr_title = re.sub(r'[^a-z0-9]', '', curr_title.lower())
-            
-            if clean_inc_title and clean_curr_title:
-                score = fuzz.ratio(clean_inc_title, clean_curr_title)
-                if score > 92: # Aggressive matching score to catch trailing periods or typos
-                    match = mp
-                    break
+def prefetch_paper_matches(papers, pub_index, hydrate=True, timings=None):
+    """
+    Read-only half of the linker: parses the payload, scores it against a snapshot of
+    the index and hydrates the rows it hit. Safe to run without holding the write lock.
+    """
+    started = time.perf_counter()
+    parsed = [parse_incoming_paper(p) for p in papers]
+    _add_time(timings, "normalize", started)
+
+    snapshot = min(len(pub_index["titles"]), len(pub_index["rows"]))
+    batch_hits = [None] * len(parsed)
+    fuzzy_from = 0
+    hydration = {}
+    if getattr(config, "linker_batch_matching", True):
+        started = time.perf_counter()
+        batch_hits = match_titles_batch(pub_index, [f["clean_title"] for f in parsed], workers=getattr(config, "linker_match_workers", -1), limit=snapshot)
+        fuzzy_from = snapshot
+        hits = [find_master_match(pub_index, f["doi"], f["clean_title"], batch_hit=hit, fuzzy_from=snapshot, fuzzy_to=snapshot)
+                for f, hit in zip(parsed, batch_hits) if f["title"]]
+        _add_time(timings, "match", started)
+
+        # Fetch the merge columns of every snapshot hit up front (into a side table; the
+        # shared rows are only filled in the locked phase) so that phase only touches memory
+        if hydrate:
+            started = time.perf_counter()
+            hydration = fetch_hydration([m for m in hits if m])
+            _add_time(timings, "fetch", started)
+    return {"parsed": parsed, "batch_hits": batch_hits, "fuzzy_from": fuzzy_from, "hydration": hydration}
+
+def _plan_match(pub_index, overlay, f, batch_hit, fuzzy_from):
+    """find_master_match over the shared index plus this payload's overlay (exact hits first, in either)."""
+    doi = normalize_doi(f["doi"])
+    for index in (pub_index, overlay):
+        if doi and doi in index["by_doi"]:
+            return index["by_doi"][doi]
+    for index in (pub_index, overlay):
+        if f["clean_title"] and f["clean_title"] in index["by_title"]:
+            return index["by_title"][f["clean_title"]]
+    return (find_master_match(pub_index, doi, f["clean_title"], batch_hit=batch_hit, fuzzy_from=fuzzy_from)
+            or find_master_match(overlay, doi, f["clean_title"]))
+
+def plan_paper_links(papers, source, master_uuid, pub_index, prefetched=None, hydrate=True, timings=None):
+    """
+    Matches a payload's papers against the index and returns (new_master_papers,
+    pending_updates, row_patches): pending_updates maps master id -> merged patch,
+    row_patches lists (indexed row, merged patch). Nothing is written and the plan
+    lives in a payload-local overlay; the caller merges it into the shared index with
+    commit_paper_links once the writes went through, so a failed write leaves no
+    phantom or falsely filled rows behind. Hydration still fills matched rows in
+    place, so concurrent callers must hold the write lock.
+    """
+    if prefetched is None:
+        prefetched = prefetch_paper_matches(papers, pub_index, hydrate=hydrate, timings=timings)
+    parsed, batch_hits, fuzzy_from = prefetched["parsed"], prefetched["batch_hits"], prefetched["fuzzy_from"]
+    new_master_papers = []
+    pending_updates = {} # master id -> merged patch, flushed in bulk by the caller
+    overlay = build_publication_index([], use_lsh=False) # this payload's new papers and DOI aliases
+
+    # 3a. Deduplicate
+    started = time.perf_counter()
+    matched = []
+    for f, batch_hit in zip(parsed, batch_hits):
+        if not f["title"]: continue
         
+        match = _plan_match(pub_index, overlay, f, batch_hit, fuzzy_from)
         if match:
-            # Update existing golden record with new source flags
-            updates = {
-                f"in_{source}": True, 
-                f"{source}_citations": citations
-            }
-            
-            # --- THE ARRAY APPEND LOGIC ---
-            # Extract the active array, append new UUID if missing, and push it back!
-            current_ids = match.get("master_author_ids") or []
-            if master_uuid not in current_ids:
-                current_ids.append(master_uuid)
-                updates["master_author_ids"] = current_ids
-            if not match.get("doi") and doi: updates["doi"] = doi
-            if not match.get("abstract") and abstract_txt: updates["abstract"] = abstract_txt
-            if year and (not match.get("publication_year") or match.get("publication_year") > 2099 or match.get("publication_year") < 1900): updates["publication_year"] = year
-            if not match.get("source_name") and source_name: updates["source_name"] = source_name
-            if not match.get("authors_list") and authors_list: updates["authors_list"] = authors_list
-            if not match.get("volume_issue_pages") and vol_str: updates["volume_issue_pages"] = vol_str
-            if not match.get("paper_url") and paper_url: updates["paper_url"] = paper_url
-            
-            if source == "wos":
-                if p.get("Category"): updates["wos_category"] = p.get("Category")
-                if p.get("Publisher_URL"): updates["publisher_url"] = p.get("Publisher_URL")
-            
-            if "id" in match:
-                supabase.table("master_publications").update(updates).eq("id", match["id"]).execute()
-                updated_count += 1
-            else:
-                match.update(updates)
+            if not match.get("doi") and f["doi"]:
+                overlay["by_doi"].setdefault(normalize_doi(f["doi"]), match)
+            matched.append((f, match))
         else:
             # Stage a brand new golden record
-            new_paper = {
-                "master_author_ids": [master_uuid], 
-                "title": title, 
-                "doi": doi,
-                "publication_year": year, 
-                "source_name": source_name,
-                "authors_list": authors_list, 
-                "abstract": abstract_txt,
-                "paper_url": paper_url,
-                f"in_{source}": True, 
-                f"{source}_citations": citations,
-                "academic_year": f"{year}-{year+1}" if 1900 <= year <= 2099 else "N/A",
-                "department": "CSE"
-            }
-            if source == "scholar":
-                new_paper["volume_issue_pages"] = f"Vol: {p.get('Volume', '')}, Iss: {p.get('Issue', '')}, Pgs: {p.get('Pages', '')}"
-            elif source == "wos":
-                new_paper["wos_category"] = p.get("Category")
-                new_paper["publisher_url"] = p.get("Publisher_URL")
-            
+            new_paper = build_new_master_paper(f, source, master_uuid)
             new_master_papers.append(new_paper)
-            existing_master.append(new_paper) # Add to local memory so we don't duplicate within the same payload
+            index_publication(overlay, new_paper) # so we don't duplicate within the same payload
 
-    # 4. Insert entirely new records
-    if new_master_papers: 
-        supabase.table("master_publications").insert(new_master_papers).execute()
-    
+    _add_time(timings, "match", started)
+
+    # 3b. Merge (the key mirror only carries ids/titles/DOIs, so pull the merge columns for hits)
+    if hydrate:
+        started = time.perf_counter()
+        hydrate_master_rows([match for _, match in matched], fetched=prefetched.get("hydration"))
+        _add_time(timings, "fetch", started)
+
+    started = time.perf_counter()
+    local = {id(paper) for paper in new_master_papers}
+    patches = {} # id(indexed row) -> (row, planned view of it, merged patch)
+    for f, match in matched:
+        if id(match) in local:
+            # A paper this payload inserts: the patch simply goes into the insert
+            match.update(build_match_updates(f, match, source, master_uuid, loaded_only=not hydrate))
+            continue
+        # Update existing golden record with new source flags. Later papers of this payload
+        # see the planned view; the indexed row only changes in commit_paper_links
+        row, view, merged = patches.setdefault(id(match), (match, dict(match), {}))
+        updates = build_match_updates(f, view, source, master_uuid, loaded_only=not hydrate)
+        view.update(updates)
+        merged.update(updates)
+        if "id" in match:
+            pending_updates.setdefault(match["id"], {"title": match.get("title")}).update(updates)
+    _add_time(timings, "plan", started)
+
+    return new_master_papers, pending_updates, [(row, merged) for row, _, merged in patches.values()]
+
+def commit_paper_links(pub_index, new_master_papers=(), row_patches=(), failed_ids=()):
+    """
+    Merges a plan into the shared index after its writes succeeded: new papers are
+    indexed, and patches are applied to the indexed rows (so the next author's
+    fill-if-empty checks see what this one filled; first fill wins). Rows in
+    `failed_ids` were rejected by the database and keep their indexed state.
+    """
+    for paper in new_master_papers:
+        index_publication(pub_index, paper)
+    for row, updates in row_patches:
+        if row.get("id") in failed_ids:
+            continue
+        row.update(updates)
+        if updates.get("doi"):
+            pub_index["by_doi"].setdefault(normalize_doi(updates["doi"]), row)
+
+def run_targeted_linker(payload: dict, source: str, author_index=None, pub_index=None, write_lock=None, dry_run=False):
+    """
+    Links one payload to the Golden Records. Parallel callers sharing `author_index` /
+    `pub_index` pass a common `write_lock`: scoring and hydration run concurrently,
+    while author resolution, planning against the shared index and the writes are
+    serialized, so two workers never create or patch the same golden paper blindly.
+
+    With `dry_run` nothing is written: the planned author change, paper inserts and
+    paper updates are returned as a diff together with per-phase timings. Passing both
+    indexes makes a dry run fully offline (no reads either); the indexes are updated
+    as if the writes had happened, so several payloads can be chained.
+    """
+    lock = write_lock or nullcontext()
+    timings = {"fetch": 0.0, "normalize": 0.0, "match": 0.0, "plan": 0.0, "write": 0.0}
+    offline = dry_run and author_index is not None and pub_index is not None
+    print("\n" + "="*60)
+    print(f"🧠 STARTING IDENTITY RESOLUTION ({source.upper()}){' [DRY RUN]' if dry_run else ''}")
+    print("="*60)
+
+    profile = payload["profile"]
+    papers = payload["papers"]
+
+    # 1. Resolve the Master Author
+    started = time.perf_counter()
+    with metrics.span("pipeline.author_resolution", source=source) as sp, lock:
+        author_diff = resolve_master_author(profile, source, author_index=author_index, dry_run=dry_run)
+        sp.add_items(1)
+    master_uuid = author_diff["id"] if dry_run else author_diff
+
+    # The matching span ends inside the lock, right before the writes it planned
+    matching = metrics.start_span("pipeline.paper_matching", source=source)
+    try:
+        # 2. Index EXISTING Master Papers globally for True Cross-Author Deduplication
+        # (incremental sync of the local key mirror instead of a full-table download)
+        if pub_index is None:
+            pub_index = build_publication_index(sync_master_publications())
+        _add_time(timings, "fetch", started)
+
+        print(f"   🔎 Cross-referencing {len(papers)} incoming papers against {len(pub_index['rows'])} existing master records...")
+
+        prefetched = prefetch_paper_matches(papers, pub_index, hydrate=not offline, timings=timings)
+
+        with lock:
+            # 3. Deduplicate and Merge (re-checks rows other workers indexed since the snapshot)
+            new_master_papers, pending_updates, row_patches = plan_paper_links(papers, source, master_uuid, pub_index, prefetched, hydrate=not offline, timings=timings)
+            update_rows = [{"id": m_id, **patch} for m_id, patch in pending_updates.items()]
+            matching.add_items(len(papers))
+            matching.finish()
+
+            if dry_run:
+                # Chained dry runs see the plan as if it had been written
+                commit_paper_links(pub_index, new_master_papers, row_patches)
+            else:
+                started = time.perf_counter()
+                with metrics.span("pipeline.link_write", source=source) as sp:
+                    # 4. Insert entirely new records (ids are copied back so a shared index stays usable)
+                    if new_master_papers: 
+                        res = supabase.table("master_publications").insert(new_master_papers).execute()
+                        for paper, row in zip(new_master_papers, res.data or []):
+                            paper["id"] = row["id"]
+                        commit_paper_links(pub_index, [paper for paper in new_master_papers if "id" in paper])
+
+                    # 5. Patch matched records in a few batched upserts keyed on id.
+                    # The unchanged title rides along so the INSERT half of the upsert passes NOT NULL checks.
+                    failures = bulk_upsert("master_publications", update_rows, on_conflict="id", chunk_size=getattr(config, "linker_update_chunk_size", None))
+                    commit_paper_links(pub_index, row_patches=row_patches, failed_ids={row["id"] for row, _ in failures})
+                    sp.add_items(len(new_master_papers) + len(update_rows))
+                _add_time(timings, "write", started)
+    finally:
+        matching.finish()
+
+    print("   ⏱️ " + " | ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    if dry_run:
+        print(f"   📝 DRY RUN: would {author_diff['action']} author {master_uuid}, insert {len(new_master_papers)} and update {len(update_rows)} master papers.")
+        return {
+            "source": source,
+            "master_uuid": master_uuid,
+            "author": author_diff,
+            "inserts": new_master_papers,
+            "updates": update_rows,
+            "timings": timings,
+        }
+
+    updated_count = len(update_rows) - len(failures)
+    if failures:
+        # Not linked: callers (pipeline ledger, bulk job counts) must not record this author as done
+        raise RuntimeError(f"{len(failures)} of {len(update_rows)} master paper updates were rejected "
+                           f"({len(new_master_papers)} new papers and {updated_count} updates were written)")
     print(f"   ✅ LINK COMPLETE: {len(new_master_papers)} new master papers created, {updated_count} existing updated.")
-    return master_uuid
\ No newline at end of file
+    return master_uuid
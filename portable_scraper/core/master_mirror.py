@@ -0,0 +1,96 @@
+import json
+import os
+from datetime import datetime, timedelta
+from portable_scraper.core.config import app_config as config
+from portable_scraper.core.supabase_client import supabase, backend_cache_folder
+
+# ==========================================
+# 1. LOCAL MIRROR OF MASTER PUBLICATION KEYS
+# ==========================================
+# Only the columns identity resolution needs are mirrored (no abstracts).
+# Rows are refreshed incrementally using a change cursor (default: updated_at,
+# kept current by the trigger in schema_updates.sql). updated_at is stamped when a
+# transaction starts, so a row can commit after later-stamped rows were already
+# read; every sync re-reads master_sync_overlap_minutes before the watermark.
+MIRROR_FIELDS = ["id", "doi", "title", "master_author_ids"]
+PAGE_SIZE = 1000
+
+def mirror_path():
+    return os.path.join(backend_cache_folder(), "master_publications_mirror.json")
+
+def load_mirror():
+    path = mirror_path()
+    if not os.path.exists(path):
+        return {"watermark": None, "rows": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"   ⚠️ Mirror unreadable ({e}). Rebuilding from scratch.")
+        return {"watermark": None, "rows": {}}
+
+def save_mirror(mirror):
+    """Atomic write: a crash mid-save leaves the previous mirror intact."""
+    path = mirror_path()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(mirror, f)
+    os.replace(tmp_path, path)
+
+def _sync_from(watermark):
+    """The watermark minus the overlap window (unchanged if it is not a timestamp)."""
+    if not watermark:
+        return watermark
+    try:
+        stamp = datetime.fromisoformat(str(watermark).replace("Z", "+00:00"))
+    except ValueError:
+        return watermark
+    return (stamp - timedelta(minutes=getattr(config, "master_sync_overlap_minutes", 5))).isoformat()
+
+def _fetch_pages(columns, cursor=None, watermark=None):
+    rows = []
+    offset = 0
+    while True:
+        query = supabase.table("master_publications").select(columns)
+        if cursor:
+            if watermark: query = query.gte(cursor, watermark)
+            query = query.order(cursor).order("id")
+        res = query.range(offset, offset + PAGE_SIZE - 1).execute()
+        if not res.data:
+            break
+        rows.extend(res.data)
+        if len(res.data) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return rows
+
+# ==========================================
+# 2. INCREMENTAL SYNC
+# ==========================================
+def sync_master_publications(full=False):
+    """
+    Brings the local mirror up to date and returns its rows.
+    Only rows changed since the stored watermark are downloaded; `full=True`
+    (or a missing cursor column) falls back to a keys-only full reload,
+    which also drops rows deleted upstream.
+    """
+    cursor = getattr(config, "master_sync_cursor", "updated_at")
+    mirror = {"watermark": None, "rows": {}} if full else load_mirror()
+    columns = ", ".join(MIRROR_FIELDS + [cursor])
+
+    try:
+        changed = _fetch_pages(columns, cursor, _sync_from(mirror["watermark"]))
+    except Exception as e:
+        print(f"   ⚠️ Incremental sync unavailable ({e}). Falling back to a full key reload.")
+        mirror = {"watermark": None, "rows": {}}
+        changed = _fetch_pages(", ".join(MIRROR_FIELDS))
+        cursor = None
+
+    for row in changed:
+        if cursor and row.get(cursor) and (mirror["watermark"] is None or row[cursor] > mirror["watermark"]):
+            mirror["watermark"] = row[cursor]
+        mirror["rows"][str(row["id"])] = {k: row.get(k) for k in MIRROR_FIELDS}
+
+    save_mirror(mirror)
+    print(f"   🔄 Master mirror synced: {len(changed)} changed rows, {len(mirror['rows'])} total.")
+    return list(mirror["rows"].values())
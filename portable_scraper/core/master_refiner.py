@@ -1,47 +1,182 @@
+import re
+import time
+from functools import lru_cache
 from portable_scraper.core.supabase_client import supabase
+from portable_scraper.core import async_store
+from portable_scraper.core.db import bulk_upsert, fetch_all
+
+# ==========================================
+# 0. VENUE CLASSIFIER
+# ==========================================
+# Keyword groups in priority order (first matching group wins). Each group is
+# compiled into one regex alternation, so a string costs one C-level scan per
+# type instead of a Python-level substring check per keyword.
+VENUE_KEYWORDS = [
+    ("Conference", ["CONF", "PROC", "SYMP", "WORKSHOP", "INTL"]),
+    ("Book/Chapter", ["BOOK", "SPRINGER", "CHAPTER", "MONOGRAPH"]),
+]
+DEFAULT_TYPE = "Journal"
+VENUE_PATTERNS = [(pub_type, re.compile("|".join(map(re.escape, keywords)))) for pub_type, keywords in VENUE_KEYWORDS]
+_TYPE_RANK = {pub_type: i for i, (pub_type, _) in enumerate(VENUE_KEYWORDS)}
+
+def _keyword_type(text):
+    """Highest-priority type whose keyword occurs in `text` (already upper-cased), or None."""
+    for pub_type, pattern in VENUE_PATTERNS:
+        if pattern.search(text):
+            return pub_type
+    return None
+
+@lru_cache(maxsize=65536)
+def classify_venue(source):
+    """Memoized: the same venue string recurs across hundreds of papers."""
+    return _keyword_type(str(source).upper()) if source else None
 
 def intelligent_classify(source, title):
-    s = str(source).upper() if source else ""
-    t = str(title).upper() if title else ""
-    
-    if any(k in s or k in t for k in ["CONF", "PROC", "SYMP", "WORKSHOP", "INTL"]): return "Conference"
-    if any(k in s or k in t for k in ["BOOK", "SPRINGER", "CHAPTER", "MONOGRAPH"]): return "Book/Chapter"
-    return "Journal"
+    venue_type = classify_venue(source)
+    if venue_type == VENUE_KEYWORDS[0][0]:
+        return venue_type
+    title_type = _keyword_type(str(title).upper()) if title else None
+    found = [t for t in (venue_type, title_type) if t]
+    return min(found, key=_TYPE_RANK.get) if found else DEFAULT_TYPE
+
+# ==========================================
+# 1. BULK AUTHOR METRIC SYNC
+# ==========================================
+# source -> (staging table, shared ID column, {master column: staging column})
+METRIC_SOURCES = {
+    "wos": ("wos_authors", "wos_id", {"wos_citations": "sum_of_times_cited", "wos_h_index": "h_index"}),
+    "scopus": ("scopus_authors", "scopus_id", {"scopus_h_index": "h_index"}),
+    "scholar": ("scholar_authors", "scholar_id", {"scholar_h_index": "h_index"}),
+}
+
+def _fetch_in(table, columns, key, values, chunk_size=100):
+    values = list(values)
+    if not values:
+        return []
+    if async_store.enabled():
+        return async_store.select_in_chunks(table, columns, key, values, chunk_size)
+    rows = []
+    for start in range(0, len(values), chunk_size):
+        rows.extend(supabase.table(table).select(columns).in_(key, values[start:start + chunk_size]).execute().data or [])
+    return rows
+
+def _fetch_in_many(lookups, chunk_size=100):
+    """
+    Several independent chunked `in_` reads: lookups is a list of (table, columns, key, values),
+    returns the row lists in the same order. With the async layer every chunk of every
+    table is in flight at once (one select_many round) instead of one table after another.
+    """
+    lookups = [(table, columns, key, list(values)) for table, columns, key, values in lookups]
+    if not async_store.enabled():
+        return [_fetch_in(table, columns, key, values, chunk_size) for table, columns, key, values in lookups]
+    queries, owners = [], []
+    for i, (table, columns, key, values) in enumerate(lookups):
+        for start in range(0, len(values), chunk_size):
+            queries.append((table, columns, [(key, "in", values[start:start + chunk_size])]))
+            owners.append(i)
+    results = [[] for _ in lookups]
+    for i, rows in zip(owners, async_store.select_many(queries) if queries else []):
+        results[i].extend(rows)
+    return results
+
+def sync_author_metrics(master_uuids, chunk_size=100):
+    """
+    Copies the per-source H-indexes / citation totals onto many golden authors at once:
+    one chunked `in_` read of master_authors, then the three source tables read
+    concurrently, an in-memory join, and a single batched upsert of only the authors
+    whose metrics changed.
+    Returns the number of authors updated.
+    """
+    master_uuids = list(dict.fromkeys(master_uuids))
+    metric_cols = [m for _, _, cols in METRIC_SOURCES.values() for m in cols]
+    id_cols = [key for _, key, _ in METRIC_SOURCES.values()]
+    masters = _fetch_in("master_authors", ", ".join(["id", "canonical_name"] + id_cols + metric_cols), "id", master_uuids, chunk_size)
+
+    lookups = [(table, ", ".join([key] + list(dict.fromkeys(cols.values()))), key, {str(m[key]) for m in masters if m.get(key)})
+               for table, key, cols in METRIC_SOURCES.values()]
+    found = {}
+    for source, rows in zip(METRIC_SOURCES, _fetch_in_many(lookups, chunk_size)):
+        found[source] = {}
+        for row in rows:
+            found[source].setdefault(str(row[METRIC_SOURCES[source][1]]), row)
+
+    patches = []
+    for m in masters:
+        m_updates = {}
+        for source, (_, key, cols) in METRIC_SOURCES.items():
+            src_row = found[source].get(str(m[key])) if m.get(key) else None
+            if src_row:
+                m_updates.update({master_col: src_row.get(src_col, 0) for master_col, src_col in cols.items()})
+        changes = {k: v for k, v in m_updates.items() if m.get(k) != v}
+        if changes:
+            # Upsert carries canonical_name so the INSERT half of the statement passes NOT NULL
+            patches.append({"id": m["id"], "canonical_name": m.get("canonical_name"), **changes})
+
+    if patches:
+        bulk_upsert("master_authors", patches, on_conflict="id")
+    print(f"   ✅ Golden Author metrics synchronized ({len(patches)}/{len(masters)} changed).")
+    return len(patches)
+
+# ==========================================
+# 2. PUBLICATION REFINEMENT
+# ==========================================
+def refined_publication_fields(p):
+    """source_name / academic_year / publication_type as the refiner wants them for one master row."""
+    source_name = p.get("source_name").upper() if p.get("source_name") else "NOT PROVIDED BY SOURCE"
+    return {
+        "source_name": source_name,
+        "academic_year": f"{p['publication_year']}-{p['publication_year']+1}" if p.get('publication_year') and 1900 <= p['publication_year'] <= 2099 else "N/A",
+        "publication_type": intelligent_classify(p.get("source_name"), p.get("title")),
+    }
+
+def _changed_publications(papers):
+    changed = []
+    for p in papers:
+        updates = refined_publication_fields(p)
+        if any(p.get(k) != v for k, v in updates.items()):
+            # Upsert carries the unchanged title so the INSERT half of the statement passes NOT NULL
+            changed.append({"id": p["id"], "title": p.get("title"), **updates})
+    return changed
+
+REFINE_COLUMNS = "id, source_name, title, publication_year, academic_year, publication_type"
+
+def refine_author_publications(master_uuid: str):
+    """Publication classification fix (targeted, set-based): only rows whose values differ are sent, in one batched upsert."""
+    papers = supabase.table("master_publications").select(REFINE_COLUMNS).contains("master_author_ids", [master_uuid]).execute().data
+
+    changed = _changed_publications(papers)
+    print(f"   📄 Classifying {len(papers)} Golden Papers ({len(changed)} need changes)...")
+    if changed:
+        bulk_upsert("master_publications", changed, on_conflict="id")
+
+def reclassify_all_publications():
+    """Whole-table pass over master_publications: one paged read, local classification, one bulk write."""
+    started = time.time()
+    papers = fetch_all("master_publications", REFINE_COLUMNS)
+    loaded = time.time()
+    changed = _changed_publications(papers)
+    classified = time.time()
+    if changed:
+        bulk_upsert("master_publications", changed, on_conflict="id")
+    print(f"   🏷️ Reclassified {len(papers)} golden papers ({len(changed)} changed). "
+          f"⏱️ fetch {loaded - started:.2f}s | classify {classified - loaded:.2f}s | write {time.time() - classified:.2f}s "
+          f"| venue cache {classify_venue.cache_info().currsize} entries")
+    return len(changed)
 
 def run_targeted_refiner(master_uuid: str):
     print("\n" + "="*60)
     print("🧹 EXECUTING INTELLIGENT REFINEMENT")
     print("="*60)
 
-    # 1. Author Metric Sync (Calculates aggregate H-Indexes safely)
-    auth = supabase.table("master_authors").select("*").eq("id", master_uuid).execute().data[0]
-    
-    m_updates = {}
-    if auth.get("wos_id"):
-        wos_data = supabase.table("wos_authors").select("sum_of_times_cited, h_index").eq("wos_id", auth["wos_id"]).execute().data
-        if wos_data: m_updates.update({"wos_citations": wos_data[0].get("sum_of_times_cited", 0), "wos_h_index": wos_data[0].get("h_index", 0)})
-        
-    if auth.get("scopus_id"):
-        sc_data = supabase.table("scopus_authors").select("h_index").eq("scopus_id", auth["scopus_id"]).execute().data
-        if sc_data: m_updates["scopus_h_index"] = sc_data[0].get("h_index", 0)
-        
-    if auth.get("scholar_id"):
-        gs_data = supabase.table("scholar_authors").select("h_index").eq("scholar_id", auth["scholar_id"]).execute().data
-        if gs_data: m_updates["scholar_h_index"] = gs_data[0].get("h_index", 0)
-
-    if m_updates:
-        supabase.table("master_authors").update(m_updates).eq("id", master_uuid).execute()
-        print("   ✅ Golden Author metrics synchronized.")
-
-    # 2. Publication Classification Fix (Targeted)
-    papers = supabase.table("master_publications").select("id, source_name, title, publication_year").contains("master_author_ids", [master_uuid]).execute().data
-    
-    print(f"   📄 Classifying {len(papers)} Golden Papers...")
-    for p in papers:
-        updates = {
-            "source_name": p.get("source_name").upper() if p.get("source_name") else "NOT PROVIDED BY SOURCE",
-            "academic_year": f"{p['publication_year']}-{p['publication_year']+1}" if p.get('publication_year') and 1900 <= p['publication_year'] <= 2099 else "N/A"
-        }
-        supabase.table("master_publications").update(updates).eq("id", p["id"]).execute()
+    sync_author_metrics([master_uuid])
+    refine_author_publications(master_uuid)
+    print("   ✅ REFINEMENT COMPLETE.")
 
-    print("   ✅ REFINEMENT COMPLETE.")
\ No newline at end of file
+def run_bulk_refiner(master_uuids):
+    """Refinement for many authors: one metric sync for all of them, then each author's papers."""
+    master_uuids = [m for m in dict.fromkeys(master_uuids) if m]
+    print(f"\n🧹 BULK REFINEMENT: {len(master_uuids)} golden authors")
+    sync_author_metrics(master_uuids)
+    for master_uuid in master_uuids:
+        refine_author_publications(master_uuid)
+    print("   ✅ BULK REFINEMENT COMPLETE.")
\ No newline at end of file
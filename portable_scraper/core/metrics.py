@@ -0,0 +1,210 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# ==========================================
+# 1. SPANS AND COUNTERS
+# ==========================================
+# A span is one timed unit of work (a scraper phase, a pipeline stage) with the
+# number of items it handled and the database requests issued from its thread
+# while it was open. Every finished span is appended to logs/metrics.jsonl, which
+# rolls over to metrics.jsonl.1 past metrics_jsonl_max_mb; aggregates per span
+# name plus the plain counters are rewritten to logs/metrics.prom (Prometheus
+# text format) by a background exporter every metrics_export_interval seconds
+# while something changed, and once more at exit.
+_lock = threading.Lock()
+_local = threading.local()
+_counters = {}      # (name, sorted label items) -> value
+_aggregates = {}    # (span name, sorted label items) -> {"count", "seconds", "items", "requests"}
+_dirty = threading.Event()
+_exporter = None
+
+def _setting(key, default):
+    # Imported lazily so the scrapers can use metrics without loading the app config first
+    from portable_scraper.core.config import app_config as config
+    return getattr(config, key, default)
+
+def _folder():
+    from portable_scraper.core.config import resolve_path
+    folder = resolve_path(_setting("metrics_folder", "logs"))
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def _append_record(record):
+    """Caller holds _lock. Appends one span to the JSONL, rolling it over when it grows too big."""
+    path = os.path.join(_folder(), "metrics.jsonl")
+    try:
+        if os.path.getsize(path) > _setting("metrics_jsonl_max_mb", 10) * 1024 * 1024:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass  # no file yet
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def _ensure_exporter():
+    global _exporter
+    with _lock:
+        if _exporter is None or not _exporter.is_alive():
+            _exporter = threading.Thread(target=_export_loop, name="metrics-export", daemon=True)
+            _exporter.start()
+
+def _export_loop():
+    while True:
+        _dirty.wait()
+        time.sleep(_setting("metrics_export_interval", 15))
+        _export_if_dirty()
+
+def _export_if_dirty():
+    if not _dirty.is_set():
+        return
+    _dirty.clear()
+    try:
+        export_prometheus()
+    except OSError as e:
+        print(f"   ⚠️ Could not write metrics: {e}")
+
+atexit.register(_export_if_dirty)
+
+def _thread_requests():
+    return getattr(_local, "requests", 0)
+
+def note_request(n=1):
+    """Called by the storage layers for every request they send."""
+    if not n:
+        return
+    _local.requests = _thread_requests() + n
+    count("db_requests_total", n)
+
+def count(name, n=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+    _dirty.set()
+
+class Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.items = 0
+        self.requests = 0
+        self.started = time.perf_counter()
+        self.wall_start = time.time()
+        self._requests_at_start = _thread_requests()
+        self.parent = getattr(_local, "span", None)
+        _local.span = self
+        self.finished = False
+
+    def add_items(self, n=1):
+        self.items += n
+
+    def add_requests(self, n=1):
+        """For work that is not a storage request (page loads, tab opens)."""
+        self.requests += n
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        duration = time.perf_counter() - self.started
+        requests = self.requests + _thread_requests() - self._requests_at_start
+        _local.span = self.parent
+        record = {"ts": self.wall_start, "span": self.name, "seconds": round(duration, 4),
+                  "items": self.items, "requests": requests, **self.labels}
+        key = (self.name, tuple(sorted(self.labels.items())))
+        with _lock:
+            agg = _aggregates.setdefault(key, {"count": 0, "seconds": 0.0, "items": 0, "requests": 0})
+            agg["count"] += 1
+            agg["seconds"] += duration
+            agg["items"] += self.items
+            agg["requests"] += requests
+            try:
+                _append_record(record)
+            except OSError as e:
+                print(f"   ⚠️ Could not write metrics: {e}")
+        _dirty.set()
+        _ensure_exporter()
+
+def start_span(name, **labels):
+    """Explicit form for code that cannot be re-indented under a `with` block; call .finish()."""
+    return Span(name, labels)
+
+@contextmanager
+def span(name, **labels):
+    s = Span(name, labels)
+    try:
+        yield s
+    finally:
+        s.finish()
+
+class PhaseTimer:
+    """
+    Sequential phases of one run (e.g. a scraper): start("search") closes the
+    previous phase and opens the next, finish() closes the last one.
+    """
+    def __init__(self, prefix, **labels):
+        self.prefix = prefix
+        self.labels = labels
+        self.current = None
+
+    def start(self, phase):
+        self.finish()
+        self.current = Span(f"{self.prefix}.{phase}", dict(self.labels))
+        return self.current
+
+    def items(self, n=1):
+        if self.current: self.current.add_items(n)
+
+    def request(self, n=1):
+        if self.current: self.current.add_requests(n)
+
+    def finish(self):
+        if self.current:
+            self.current.finish()
+            self.current = None
+
+# ==========================================
+# 2. PROMETHEUS TEXT EXPORT
+# ==========================================
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels) + "}"
+
+def export_prometheus(path=None):
+    path = path or os.path.join(_folder(), "metrics.prom")
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        aggregates = {k: dict(v) for k, v in _aggregates.items()}
+
+    lines.append("# TYPE pulse_span_seconds summary")
+    for (name, labels), agg in sorted(aggregates.items()):
+        lbl = _label_str((("span", name),) + labels)
+        lines.append(f"pulse_span_seconds_sum{lbl} {agg['seconds']:.6f}")
+        lines.append(f"pulse_span_seconds_count{lbl} {agg['count']}")
+    lines.append("# TYPE pulse_span_items_total counter")
+    for (name, labels), agg in sorted(aggregates.items()):
+        lines.append(f"pulse_span_items_total{_label_str((('span', name),) + labels)} {agg['items']}")
+    lines.append("# TYPE pulse_span_requests_total counter")
+    for (name, labels), agg in sorted(aggregates.items()):
+        lines.append(f"pulse_span_requests_total{_label_str((('span', name),) + labels)} {agg['requests']}")
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE pulse_{name} counter")
+        lines.append(f"pulse_{name}{_label_str(labels)} {value}")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+def snapshot():
+    """Aggregates per span name, for printing a run summary."""
+    with _lock:
+        return {name + _label_str(labels): dict(agg) for (name, labels), agg in _aggregates.items()}
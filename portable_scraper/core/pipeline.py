@@ -1,38 +1,409 @@
-from portable_scraper.core.db import push_scholar_payload, push_scopus_payload, push_wos_payload
-from portable_scraper.core.master_linker import run_targeted_linker
-from portable_scraper.core.master_refiner import run_targeted_refiner
+import hashlib
+import json
+import queue
+import threading
+import time
+from portable_scraper.core.db import push_scholar_payload, push_scopus_payload, push_wos_payload, fetch_all
+from portable_scraper.core.master_linker import (
+    run_targeted_linker, build_author_index, build_publication_index, AUTHOR_INDEX_COLUMNS
+)
+from portable_scraper.core.master_mirror import sync_master_publications
+from portable_scraper.core.master_refiner import run_targeted_refiner, run_bulk_refiner
+from portable_scraper.core.config import app_config as config
+from portable_scraper.core.write_queue import flush, queue_stats
+from portable_scraper.core.async_store import is_transient
+from portable_scraper.core import metrics, spool
 
-def run_processing_pipeline(source: str, payload: dict):
+# ==========================================
+# RUN LEDGER (resumable runs per author)
+# ==========================================
+# Stages, in the order they complete: linked (golden author + papers written),
+# staged (staging rows flushed to the server), refined. A rerun of the same
+# payload, or the drainer replaying it after a crash, skips the finished ones.
+STAGES = ("linked", "staged", "refined")
+RUN_ID_FIELDS = {"scholar": "Scholar_ID", "scopus": "Scopus_ID", "wos": "WoS_ID"}
+
+def run_key(source: str, payload: dict):
+    profile = payload.get("profile") or {}
+    author = str(profile.get(RUN_ID_FIELDS.get(source)) or "").strip() or str(profile.get("Name") or "").strip().lower()
+    return f"{source}:{author}"
+
+def payload_fingerprint(payload: dict):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _open_run(source: str, payload: dict, payload_path=None, seq=None):
+    """
+    Returns the ledger entry to work on: the unfinished run of this exact payload
+    (resume) or a new one. `seq` is passed by the drainer, whose payload is
+    already spooled and claimed.
+    """
+    key = run_key(source, payload)
+    fingerprint = payload_fingerprint(payload)
+    run = spool.find_run(key)
+    if seq is not None:
+        if run and run["seq"] == seq and run["status"] != "done":
+            return run
+        return spool.start_run(key, source, seq, fingerprint, payload_path)
+
+    if run and run["status"] != "done" and run["fingerprint"] == fingerprint and spool.claim_payload(run["seq"]):
+        done = ", ".join(run["stages"]) or "none"
+        print(f"   ♻️ Resuming run {key} (payload #{run['seq']}, finished stages: {done}).")
+        return run
+    return spool.start_run(key, source, spool.spool_payload(source, payload), fingerprint, payload_path)
+
+# Linking is serialized process-wide: GUI pipeline threads, roster stages and the
+# spool drainer each build their own view of the golden tables, so two linkers
+# running at once could both create the same golden author or paper.
+_link_lock = threading.Lock()
+
+def _push_and_link(run: dict, payload: dict, author_index=None, pub_index=None):
+    source = run["source"]
+    # Phase 1: Push to Raw/Staging Tables (idempotent: keyed upserts, unchanged rows skipped)
+    if "staged" not in run["stages"]:
+        with metrics.span("pipeline.staging_push", source=source) as sp:
+            if source == "scholar":
+                push_scholar_payload(payload)
+            elif source == "scopus":
+                push_scopus_payload(payload)
+            elif source == "wos":
+                push_wos_payload(payload)
+            else:
+                raise ValueError(f"Unknown source: {source}")
+            sp.add_items(1 + len(payload.get("papers") or []))
+
+    # Phase 2: Entity Resolution & Master Table Creation. A half-finished earlier
+    # attempt is safe to redo: its inserted papers are matched, not duplicated.
+    if "linked" in run["stages"]:
+        print(f"   ⏭️ Linking already completed (golden author {run['master_uuid']}).")
+        return run["master_uuid"]
+    with _link_lock:
+        master_uuid = run_targeted_linker(payload, source, author_index=author_index, pub_index=pub_index)
+    spool.complete_stage(run, "linked", master_uuid)
+    return master_uuid
+
+def _flush_staging(runs):
+    """
+    Staging writes are queued behind the scraper; the refiner reads the staging
+    author metrics, so they must be on the server first. Returns True when drained.
+    """
+    pending = [run for run in runs if "staged" not in run["stages"]]
+    if not pending:
+        return True
+    with metrics.span("pipeline.staging_flush") as sp:
+        sp.add_items(queue_stats()["depth"])
+        drained = flush(timeout=getattr(config, "write_queue_flush_timeout", 120))
+    if drained:
+        for run in pending:
+            spool.complete_stage(run, "staged")
+    else:
+        stats = queue_stats()
+        print(f"   ⚠️ Staging writes still queued ({stats['depth']} rows, retrying in the background). "
+              f"Refining with the metrics currently stored.")
+    return drained
+
+def _record_refined(run: dict):
+    # Refinement only counts as done on confirmed staging data
+    if "staged" in run["stages"]:
+        spool.complete_stage(run, "refined")
+    if all(stage in run["stages"] for stage in STAGES):
+        spool.finish_run(run)
+
+def _flush_and_refine(run: dict):
+    _flush_staging([run])
+
+    # Phase 3: Intelligent Refinement
+    if "refined" not in run["stages"]:
+        with metrics.span("pipeline.refinement") as sp:
+            run_targeted_refiner(run["master_uuid"])
+            sp.add_items(1)
+    _record_refined(run)
+
+def _run_phases(run: dict, payload: dict):
+    _push_and_link(run, payload)
+    _flush_and_refine(run)
+
+def _settle_payload(run: dict):
+    """
+    The spooled payload is only done once its run finished every stage. A run still
+    waiting on its staging writes keeps the payload pending, so the drainer resumes
+    it later instead of the ledger entry staying open forever. Returns True when done.
+    """
+    if run["status"] == "done":
+        spool.mark_payload(run["seq"], "done")
+        return True
+    spool.mark_payload(run["seq"], "pending", "staging writes not confirmed yet")
+    start_spool_drainer()
+    return False
+
+def _settle_result(result: dict, run: dict):
+    """Settles a staged/batch result; a run still waiting on staging writes is pending, not ok."""
+    result["ok"] = _settle_payload(run)
+    result["pending"] = not result["ok"]
+    if result["pending"]:
+        result["error"] = f"pending: staging writes not confirmed yet, payload #{run['seq']} stays spooled"
+
+def _record_failure(seq, e):
+    """Spool bookkeeping shared by both pipelines. Returns the message to report."""
+    if is_transient(e):
+        spool.mark_payload(seq, "pending", e)
+        start_spool_drainer()
+        return f"Supabase unreachable ({e}). Payload #{seq} is spooled and will be replayed automatically."
+    spool.mark_payload(seq, "failed", e)
+    return f"FATAL PIPELINE ERROR: {e}"
+
+def replay_spooled_payload(source: str, payload: dict, seq=None):
+    """Drainer callback: True when the run finished, False while it has to be retried."""
+    try:
+        run = _open_run(source, payload, seq=seq)
+        _run_phases(run, payload)
+        return run["status"] == "done"
+    except Exception as e:
+        if is_transient(e):
+            return False
+        raise
+
+def start_spool_drainer():
+    spool.start_drainer(replay_spooled_payload)
+
+def run_processing_pipeline(source: str, payload: dict, payload_path=None):
     """
     The central conveyor belt. Takes raw scraper payload, pushes to staging tables,
     links to Golden Records, and refines the final output.
+    The payload is spooled to disk first; if Supabase is unreachable it stays
+    there and is replayed in order by the spool drainer. Completed stages are
+    recorded in the run ledger, so running the same payload again resumes
+    where the previous attempt stopped.
     """
     if not payload or not payload.get("profile"):
         print("❌ Pipeline Aborted: No valid payload provided.")
         return False
 
     print(f"\n⚙️  INITIATING MASTER PIPELINE FOR: {source.upper()}")
+    run = _open_run(source, payload, payload_path)
 
     try:
-        # Phase 1: Push to Raw/Staging Tables
-        if source == "scholar":
-            push_scholar_payload(payload)
-        elif source == "scopus":
-            push_scopus_payload(payload)
-        elif source == "wos":
-            push_wos_payload(payload)
+        with metrics.span("pipeline.run", source=source):
+            _run_phases(run, payload)
+        if _settle_payload(run):
+            print("\n🎉 MASTER PIPELINE FINISHED SUCCESSFULLY.")
         else:
-            raise ValueError(f"Unknown source: {source}")
-
-        # Phase 2: Entity Resolution & Master Table Creation
-        master_uuid = run_targeted_linker(payload, source)
-
-        # Phase 3: Intelligent Refinement
-        run_targeted_refiner(master_uuid)
-        
-        print("\n🎉 MASTER PIPELINE FINISHED SUCCESSFULLY.")
+            print(f"\n🎉 MASTER PIPELINE FINISHED. Payload #{run['seq']} stays spooled until its staging writes are confirmed.")
         return True
 
     except Exception as e:
-        print(f"\n❌ FATAL PIPELINE ERROR: {e}")
-        return False
\ No newline at end of file
+        message = _record_failure(run["seq"], e)
+        print(f"\n{'📦' if is_transient(e) else '❌'} {message}")
+        return False
+
+def resume_incomplete_runs():
+    """Re-runs every unfinished ledger entry from its spooled payload. Returns {run_key: ok}."""
+    results = {}
+    for run, payload in spool.incomplete_runs():
+        results[run["run_key"]] = run_processing_pipeline(run["source"], payload, run["payload_path"])
+    return results
+
+# ==========================================
+# STAGED ROSTER PIPELINE (producer / consumer)
+# ==========================================
+# scrape (caller thread) -> [bounded queue] -> push + link -> [bounded queue] -> flush + refine
+# The browser scrapes author N+1 while author N is linked and refined. Both queues
+# are bounded (pipeline_queue_size), so a slow database makes the scraper wait
+# instead of piling payloads up in memory.
+# A stage thread never dies on a bad entry (failures, including failing spool
+# bookkeeping, are recorded on the entry), and every put waits with a timeout
+# while checking that the stage downstream is still alive, so nobody blocks forever.
+_DONE = object()
+
+def _put_while_alive(q, item, consumers):
+    """Blocking put that gives up (returns False) once a consuming thread has died."""
+    while True:
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            if not all(c.is_alive() for c in consumers):
+                return False
+
+def _stage_failure(result, e, results):
+    result["error"] = str(e)
+    if result.get("seq") is not None:
+        try:
+            result["error"] = _record_failure(result["seq"], e)
+        except Exception as spool_error:
+            result["error"] += f" (spool bookkeeping failed: {spool_error})"
+    print(f"   ❌ {result['name']}: {result['error']}")
+    result.pop("run", None)
+    results.append(result)
+
+def _stage_stopped(result, results):
+    """An entry stranded by a dead stage: its payload goes back to the spool for the drainer."""
+    result["error"] = "database stages stopped"
+    if result.get("seq") is not None:
+        try:
+            spool.mark_payload(result["seq"], "pending", result["error"])
+        except Exception as e:
+            result["error"] += f" (spool bookkeeping failed: {e})"
+    print(f"   ❌ {result['name']}: {result['error']}")
+    result.pop("run", None)
+    results.append(result)
+
+def _link_stage(inbox, outbox, results, refiner):
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            _put_while_alive(outbox, _DONE, [refiner])
+            return
+        result, payload = item
+        try:
+            result["run"] = _open_run(result["source"], payload, result.pop("payload_path", None))
+            result["seq"] = result["run"]["seq"]
+            result["master_uuid"] = _push_and_link(result["run"], payload)
+        except Exception as e:
+            _stage_failure(result, e, results)
+            continue
+        if not _put_while_alive(outbox, result, [refiner]):
+            _stage_stopped(result, results)
+            return
+
+def _refine_stage(inbox, results):
+    while True:
+        result = inbox.get()
+        if result is _DONE:
+            return
+        try:
+            _flush_and_refine(result["run"])
+            _settle_result(result, result["run"])
+        except Exception as e:
+            _stage_failure(result, e, results)
+            continue
+        result.pop("run", None)
+        results.append(result)
+
+def run_roster_pipeline(source: str, roster, scrape, queue_size=None):
+    """
+    Scrapes and processes a roster with the stages overlapped.
+    `scrape(entry)` runs on the calling thread (it owns the browser) and returns
+    (path, payload) like the run_*_scraper functions. Returns one result dict per
+    roster entry, in roster order: index, name, source, ok, pending, master_uuid, error.
+    """
+    queue_size = queue_size or getattr(config, "pipeline_queue_size", 2)
+    to_link = queue.Queue(maxsize=queue_size)
+    to_refine = queue.Queue(maxsize=queue_size)
+    results = []
+    refiner = threading.Thread(target=_refine_stage, args=(to_refine, results), name="pipeline-refine", daemon=True)
+    workers = [
+        threading.Thread(target=_link_stage, args=(to_link, to_refine, results, refiner), name="pipeline-link", daemon=True),
+        refiner,
+    ]
+    for w in workers:
+        w.start()
+
+    start = time.time()
+    print(f"\n⚙️  ROSTER PIPELINE: {len(roster)} {source.upper()} profiles (queue depth {queue_size})")
+    stopped = False
+    for index, entry in enumerate(roster):
+        name = " ".join(str(v) for v in (entry if isinstance(entry, (list, tuple)) else [entry]) if v)
+        result = {"index": index, "name": name, "source": source, "ok": False, "pending": False, "master_uuid": None, "error": None}
+        if stopped:
+            result["error"] = "not scraped: database stages stopped"
+            results.append(result)
+            continue
+        try:
+            result["payload_path"], payload = scrape(entry)
+        except Exception as e:
+            payload = None
+            result["error"] = f"scraper crashed: {e}"
+        if not payload or not payload.get("profile"):
+            result.pop("payload_path", None)
+            result["error"] = result["error"] or "scraper returned no payload"
+            print(f"   ⚠️ {name}: {result['error']}")
+            results.append(result)
+            continue
+        waited = time.time()
+        if not _put_while_alive(to_link, (result, payload), workers):  # blocks while the database side is behind
+            result["error"] = "database stages stopped"
+            print(f"   ❌ {name}: {result['error']}. Skipping the rest of the roster.")
+            results.append(result)
+            stopped = True
+            continue
+        if time.time() - waited > 1:
+            print(f"   ⏸️ Scraper waited {time.time() - waited:.1f}s for the database stages (backpressure).")
+
+    _put_while_alive(to_link, _DONE, workers)
+    for w in workers:
+        w.join()
+    # Entries still queued when a stage died
+    for q in (to_link, to_refine):
+        while not q.empty():
+            item = q.get_nowait()
+            if item is not _DONE:
+                _stage_stopped(item[0] if isinstance(item, tuple) else item, results)
+
+    results.sort(key=lambda r: r["index"])
+    ok = sum(1 for r in results if r["ok"])
+    pending = sum(1 for r in results if r["pending"])
+    print(f"\n🎉 ROSTER PIPELINE FINISHED: {ok}/{len(roster)} profiles synced in {time.time() - start:.1f}s"
+          + (f", {pending} pending staging writes." if pending else "."))
+    return results
+
+# ==========================================
+# BATCH PIPELINE (shared caches)
+# ==========================================
+# run_processing_pipeline rebuilds its lookups per payload: the golden author list
+# and ID waterfall, and the publication index. A batch loads both once, lets the
+# linker keep them current as it creates and patches golden records, then flushes
+# staging once and refines every linked author in one bulk pass.
+def run_batch_pipeline(items):
+    """
+    Processes an iterable of (source, payload) or (source, payload, payload_path).
+    Returns one result dict per item, in input order: index, name, source, ok,
+    pending, master_uuid, seq, error. A failing payload is recorded and the batch
+    moves on; one whose staging writes are only spooled is pending, not ok.
+    """
+    start = time.time()
+    print("\n⚙️  BATCH PIPELINE: loading golden author and publication caches...")
+    with metrics.span("pipeline.batch") as batch_span:
+        author_index = build_author_index(fetch_all("master_authors", AUTHOR_INDEX_COLUMNS), ids_loaded=True)
+        pub_index = build_publication_index(sync_master_publications())
+
+        results, linked = [], []
+        for index, item in enumerate(items):
+            source, payload = item[0], item[1]
+            payload_path = item[2] if len(item) > 2 else None
+            name = ((payload or {}).get("profile") or {}).get("Name") or "?"
+            result = {"index": index, "name": name, "source": source, "ok": False, "pending": False, "master_uuid": None, "seq": None, "error": None}
+            results.append(result)
+            if not payload or not payload.get("profile"):
+                result["error"] = "no valid payload"
+                continue
+            try:
+                run = _open_run(source, payload, payload_path)
+                result["seq"] = run["seq"]
+                result["master_uuid"] = _push_and_link(run, payload, author_index=author_index, pub_index=pub_index)
+                linked.append((result, run))
+            except Exception as e:
+                result["error"] = _record_failure(result["seq"], e) if result["seq"] else str(e)
+                print(f"   ❌ {name}: {result['error']}")
+        batch_span.add_items(len(results))
+
+        if linked:
+            try:
+                _flush_staging([run for _, run in linked])
+                to_refine = [run["master_uuid"] for _, run in linked if "refined" not in run["stages"]]
+                if to_refine:
+                    with metrics.span("pipeline.refinement") as sp:
+                        run_bulk_refiner(to_refine)
+                        sp.add_items(len(to_refine))
+                for result, run in linked:
+                    _record_refined(run)
+                    _settle_result(result, run)
+            except Exception as e:
+                for result, run in linked:
+                    result["error"] = _record_failure(run["seq"], e)
+                print(f"   ❌ Batch refinement failed: {e}")
+
+    ok = sum(1 for r in results if r["ok"])
+    pending = sum(1 for r in results if r["pending"])
+    print(f"\n🎉 BATCH PIPELINE FINISHED: {ok}/{len(results)} payloads synced in {time.time() - start:.1f}s"
+          + (f", {pending} pending staging writes." if pending else "."))
+    return results
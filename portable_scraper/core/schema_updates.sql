@@ -0,0 +1,52 @@
+-- ==========================================
+-- Schema additions required by the pipeline.
+-- Run once in the Supabase SQL editor. Every statement is idempotent.
+-- ==========================================
+
+-- 1. Change cursor for the incremental master_publications mirror (master_mirror.py)
+ALTER TABLE master_publications ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS master_publications_updated_at_idx ON master_publications (updated_at, id);
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS master_publications_touch ON master_publications;
+CREATE TRIGGER master_publications_touch BEFORE UPDATE ON master_publications
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+-- 2. Natural key for the Scopus / WoS staging papers (db.paper_natural_key)
+-- sha256(<source id or 'NAME:' || author_name> || '|' || normalized title), hex encoded.
+-- Existing rows are backfilled with the same formula and exact duplicates collapsed
+-- (lowest id kept) before the unique index is created.
+ALTER TABLE scopus_papers ADD COLUMN IF NOT EXISTS paper_key text;
+UPDATE scopus_papers SET paper_key = encode(sha256(convert_to(
+    coalesce(nullif(scopus_id, ''), 'NAME:' || coalesce(author_name, '')) || '|' ||
+    regexp_replace(lower(coalesce(title, '')), '[^a-z0-9]', '', 'g'), 'UTF8')), 'hex')
+WHERE paper_key IS NULL;
+DELETE FROM scopus_papers a USING scopus_papers b
+WHERE a.paper_key = b.paper_key AND a.id > b.id;
+CREATE UNIQUE INDEX IF NOT EXISTS scopus_papers_paper_key_idx ON scopus_papers (paper_key);
+
+ALTER TABLE wos_papers ADD COLUMN IF NOT EXISTS paper_key text;
+UPDATE wos_papers SET paper_key = encode(sha256(convert_to(
+    coalesce(nullif(wos_id, ''), 'NAME:' || coalesce(author_name, '')) || '|' ||
+    regexp_replace(lower(coalesce(title, '')), '[^a-z0-9]', '', 'g'), 'UTF8')), 'hex')
+WHERE paper_key IS NULL;
+DELETE FROM wos_papers a USING wos_papers b
+WHERE a.paper_key = b.paper_key AND a.id > b.id;
+CREATE UNIQUE INDEX IF NOT EXISTS wos_papers_paper_key_idx ON wos_papers (paper_key);
+
+-- 3. Content hashes for change detection on the staging tables (db.split_unchanged)
+ALTER TABLE scholar_authors ADD COLUMN IF NOT EXISTS content_hash text;
+ALTER TABLE scholar_papers ADD COLUMN IF NOT EXISTS content_hash text;
+ALTER TABLE scopus_authors ADD COLUMN IF NOT EXISTS content_hash text;
+ALTER TABLE scopus_papers ADD COLUMN IF NOT EXISTS content_hash text;
+ALTER TABLE wos_authors ADD COLUMN IF NOT EXISTS content_hash text;
+ALTER TABLE wos_papers ADD COLUMN IF NOT EXISTS content_hash text;
+
+-- 4. Venue classification written by the refiner (master_refiner.intelligent_classify)
+ALTER TABLE master_publications ADD COLUMN IF NOT EXISTS publication_type text;
@@ -0,0 +1,350 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from portable_scraper.core.config import app_config as config
+from portable_scraper.core.supabase_client import backend_cache_folder
+
+# ==========================================
+# 1. DURABLE ON-DISK SPOOL (SQLite, WAL, synchronous=FULL)
+# ==========================================
+# Every payload is committed here before the pipeline touches the network, and
+# only marked done once the pipeline finished. Staging writes the write-behind
+# queue could not deliver before exit are spooled too. A background drainer
+# replays both, oldest first, once Supabase answers again, so a finished scrape
+# is never lost to a dropped connection.
+_lock = threading.Lock()
+_drainer = None
+_recovered = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payloads (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    source     TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    status     TEXT NOT NULL DEFAULT 'pending',  -- active | pending | done | failed
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payloads_status_idx ON payloads (status, seq);
+CREATE TABLE IF NOT EXISTS writes (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name  TEXT NOT NULL,
+    on_conflict TEXT,
+    rows        TEXT NOT NULL,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_key      TEXT PRIMARY KEY,              -- source + author id (see pipeline.run_key)
+    source       TEXT NOT NULL,
+    seq          INTEGER NOT NULL,              -- payloads.seq holding the scraped payload
+    fingerprint  TEXT NOT NULL,
+    payload_path TEXT,                          -- the scraper's Excel output, when known
+    stages       TEXT NOT NULL DEFAULT '[]',    -- completed stages, in order
+    master_uuid  TEXT,
+    status       TEXT NOT NULL DEFAULT 'running', -- running | done
+    updated_at   REAL NOT NULL
+);
+"""
+
+def spool_path():
+    # Spooled writes and run ledgers belong to the backend they were meant for
+    return os.path.join(backend_cache_folder(), "spool.sqlite3")
+
+def _connect():
+    """
+    Caller holds _lock. The first connection of a process re-queues payloads a crash
+    left active and purges what is past spool_retention_days.
+    """
+    global _recovered
+    conn = sqlite3.connect(spool_path(), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")  # fsync on every commit
+    conn.executescript(SCHEMA)
+    if not _recovered:
+        with conn:
+            conn.execute("UPDATE payloads SET status = 'pending' WHERE status = 'active'")
+        _purge(conn)
+        _recovered = True
+    return conn
+
+def _purge(conn, retention_days=None):
+    """
+    Deletes done payloads and finished runs older than the retention window; failed
+    payloads are kept for inspection, and so is any payload an open run still needs.
+    """
+    days = retention_days if retention_days is not None else getattr(config, "spool_retention_days", 7)
+    cutoff = time.time() - days * 86400
+    with conn:
+        runs = conn.execute("DELETE FROM runs WHERE status = 'done' AND updated_at < ?", (cutoff,)).rowcount
+        payloads = conn.execute(
+            "DELETE FROM payloads WHERE status = 'done' AND created_at < ? "
+            "AND seq NOT IN (SELECT seq FROM runs WHERE status != 'done')", (cutoff,)).rowcount
+    if runs or payloads:
+        print(f"   🧹 Spool: purged {payloads} processed payloads and {runs} finished runs older than {days} days.")
+    return payloads, runs
+
+def purge_spool(retention_days=None):
+    """Drops processed payloads and finished run ledgers past the retention window. Returns (payloads, runs)."""
+    with _lock:
+        conn = _connect()
+        try:
+            return _purge(conn, retention_days)
+        finally:
+            conn.close()
+
+def spool_payload(source, payload, status="active"):
+    """
+    Persists a scraped payload and returns its sequence number. 'active' payloads
+    belong to a running pipeline; the drainer only picks up 'pending' ones.
+    """
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    "INSERT INTO payloads (source, payload, status, created_at) VALUES (?, ?, ?, ?)",
+                    (source, json.dumps(payload, default=str), status, time.time()))
+            return cur.lastrowid
+        finally:
+            conn.close()
+
+def mark_payload(seq, status, error=None):
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE payloads SET status = ?, attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                    (status, str(error) if error else None, seq))
+        finally:
+            conn.close()
+
+def claim_payload(seq):
+    """Marks a pending/failed/done payload active. False when another worker already runs it."""
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                cur = conn.execute("UPDATE payloads SET status = 'active' WHERE seq = ? AND status != 'active'", (seq,))
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+def spool_writes(table, on_conflict, rows):
+    """Persists staging rows that could not be delivered (see write_queue._drain_on_exit)."""
+    if not rows:
+        return
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO writes (table_name, on_conflict, rows, created_at) VALUES (?, ?, ?, ?)",
+                    (table, on_conflict, json.dumps(rows, default=str), time.time()))
+        finally:
+            conn.close()
+
+def pending_payloads():
+    """(seq, source, payload) of every payload not yet processed, oldest first."""
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute("SELECT seq, source, payload FROM payloads WHERE status = 'pending' ORDER BY seq").fetchall()
+        finally:
+            conn.close()
+    return [(seq, source, json.loads(payload)) for seq, source, payload in rows]
+
+def take_pending_writes():
+    """Removes and returns every spooled staging write, oldest first."""
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                rows = conn.execute("SELECT seq, table_name, on_conflict, rows FROM writes ORDER BY seq").fetchall()
+                if rows:
+                    conn.execute("DELETE FROM writes WHERE seq <= ?", (rows[-1][0],))
+        finally:
+            conn.close()
+    return [(table, on_conflict, json.loads(data)) for _, table, on_conflict, data in rows]
+
+def spool_stats():
+    with _lock:
+        conn = _connect()
+        try:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM payloads GROUP BY status").fetchall())
+            writes = conn.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+        finally:
+            conn.close()
+    return {"active": counts.get("active", 0), "pending": counts.get("pending", 0), "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0), "pending_write_batches": writes}
+
+# ==========================================
+# 2. BACKGROUND DRAINER
+# ==========================================
+def start_drainer(replay):
+    """
+    Starts (once) the thread that replays the spool in order.
+    `replay(source, payload, seq)` returns True when done, False when the backend is
+    still unreachable (stop and back off), or raises for a payload that can
+    never succeed (marked failed, kept for inspection).
+    """
+    global _drainer
+    with _lock:
+        if _drainer is not None and _drainer.is_alive():
+            return
+        _drainer = threading.Thread(target=_drain_loop, args=(replay,), name="spool-drainer", daemon=True)
+        _drainer.start()
+
+def _drain_loop(replay):
+    # Imported here: write_queue spools into this module at exit
+    from portable_scraper.core.write_queue import enqueue
+
+    interval = getattr(config, "spool_retry_interval", 30)
+    attempt = 0
+    # Runs an earlier session left unfinished are resumed like any other spooled payload
+    requeued = requeue_incomplete_runs()
+    stats = spool_stats()
+    if requeued or stats["pending"] or stats["pending_write_batches"]:
+        print(f"   📦 Spool: {stats['pending']} payloads to replay ({requeued} unfinished runs resumed), "
+              f"{stats['pending_write_batches']} write batches, {stats['failed']} failed kept for inspection.")
+    last_purge = time.time()
+    while True:
+        for table, on_conflict, rows in take_pending_writes():
+            print(f"   📤 Replaying {len(rows)} spooled {table} rows.")
+            enqueue(table, rows, on_conflict=on_conflict)
+
+        blocked = False
+        for seq, source, payload in pending_payloads():
+            if not claim_payload(seq):
+                continue  # picked up by a pipeline run in the meantime
+            name = (payload.get("profile") or {}).get("Name", "?")
+            print(f"   📤 Replaying spooled {source.upper()} payload #{seq} ({name})...")
+            try:
+                ok = replay(source, payload, seq)
+            except Exception as e:
+                print(f"   ❌ Spooled payload #{seq} failed permanently: {e}")
+                mark_payload(seq, "failed", e)
+                continue
+            if not ok:
+                mark_payload(seq, "pending")
+                blocked = True  # keep order: later payloads wait for this one
+                break
+            mark_payload(seq, "done")
+
+        if not blocked:
+            attempt = 0
+            if time.time() - last_purge > 3600:
+                purge_spool()
+                last_purge = time.time()
+            time.sleep(interval)
+            continue
+        attempt += 1
+        delay = random.uniform(interval / 2, min(getattr(config, "spool_retry_max", 600), interval * 2 ** attempt))
+        print(f"   💤 Backend still unreachable. Next spool replay in {delay:.0f}s.")
+        time.sleep(delay)
+
+# ==========================================
+# 3. PER-AUTHOR RUN LEDGER
+# ==========================================
+# One row per author and source: which pipeline stages of the latest payload
+# finished, and where that payload lives (its spool seq and Excel path). A run
+# interrupted by a crash resumes from the first unfinished stage instead of
+# re-scraping; every stage is idempotent, so redoing a half-written one is safe.
+def _run_row(row):
+    if not row:
+        return None
+    run_key, source, seq, fingerprint, payload_path, stages, master_uuid, status = row
+    return {"run_key": run_key, "source": source, "seq": seq, "fingerprint": fingerprint, "payload_path": payload_path,
+            "stages": json.loads(stages), "master_uuid": master_uuid, "status": status}
+
+_RUN_COLUMNS = "run_key, source, seq, fingerprint, payload_path, stages, master_uuid, status"
+
+def find_run(run_key):
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute(f"SELECT {_RUN_COLUMNS} FROM runs WHERE run_key = ?", (run_key,)).fetchone()
+        finally:
+            conn.close()
+    return _run_row(row)
+
+def start_run(run_key, source, seq, fingerprint, payload_path=None):
+    """
+    Opens a fresh run for a newly spooled payload. An unfinished run it replaces
+    is retired together with its payload, so the drainer never replays stale data.
+    """
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                old = conn.execute("SELECT seq FROM runs WHERE run_key = ? AND status != 'done'", (run_key,)).fetchone()
+                if old and old[0] != seq:
+                    conn.execute("UPDATE payloads SET status = 'done', last_error = ? WHERE seq = ? AND status != 'active'",
+                                 (f"superseded by #{seq}", old[0]))
+                conn.execute(
+                    "INSERT OR REPLACE INTO runs (run_key, source, seq, fingerprint, payload_path, stages, master_uuid, status, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, '[]', NULL, 'running', ?)",
+                    (run_key, source, seq, fingerprint, payload_path, time.time()))
+        finally:
+            conn.close()
+    return find_run(run_key)
+
+def complete_stage(run, stage, master_uuid=None):
+    """Records `stage` as finished (in the ledger and in the `run` dict)."""
+    if stage not in run["stages"]:
+        run["stages"].append(stage)
+    if master_uuid:
+        run["master_uuid"] = master_uuid
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                # seq guard: a newer run of the same author may have replaced this entry
+                conn.execute("UPDATE runs SET stages = ?, master_uuid = COALESCE(?, master_uuid), updated_at = ? WHERE run_key = ? AND seq = ?",
+                             (json.dumps(run["stages"]), master_uuid, time.time(), run["run_key"], run["seq"]))
+        finally:
+            conn.close()
+
+def finish_run(run):
+    run["status"] = "done"
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("UPDATE runs SET status = 'done', updated_at = ? WHERE run_key = ? AND seq = ?",
+                             (time.time(), run["run_key"], run["seq"]))
+        finally:
+            conn.close()
+
+def incomplete_runs():
+    """
+    Unfinished runs with their payloads, oldest first: [(run, payload)]. Runs whose
+    payload failed permanently, or is being processed right now, are left out.
+    """
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join('r.' + c.strip() for c in _RUN_COLUMNS.split(','))}, p.payload FROM runs r "
+                "JOIN payloads p ON p.seq = r.seq WHERE r.status != 'done' AND p.status IN ('pending', 'done') "
+                "ORDER BY r.updated_at").fetchall()
+        finally:
+            conn.close()
+    return [(_run_row(row[:-1]), json.loads(row[-1])) for row in rows]
+
+def requeue_incomplete_runs():
+    """Puts the payload of every unfinished run that is not queued back to pending. Returns how many."""
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    "UPDATE payloads SET status = 'pending' WHERE status = 'done' "
+                    "AND seq IN (SELECT seq FROM runs WHERE status != 'done')")
+            return cur.rowcount
+        finally:
+            conn.close()
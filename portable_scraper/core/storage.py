@@ -0,0 +1,268 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from portable_scraper.core import metrics
+
+# ==========================================
+# 1. EMBEDDED SQLITE BACKEND (PostgREST-style chain API)
+# ==========================================
+# Drop-in stand-in for the Supabase client covering what the pipeline uses:
+#   table(t).select(cols, count="exact").eq/neq/gt/gte/lt/lte/in_/contains
+#          .order(col, desc=...).range(a, b).limit(n).execute()
+#   table(t).insert(rows) / .update(values).<filters> / .upsert(rows, on_conflict=...)
+# execute() returns an object with .data (list of dicts) and .count, like postgrest.
+#
+# Columns are created on first write (schema-on-write), lists/dicts are stored as
+# JSON text and decoded on read, and `contains` on those columns uses json_each.
+# The key and lookup columns of the known tables are declared up front with
+# their indexes, so the unique conflict targets match the Supabase schema.
+SCHEMA = {
+    "master_authors": ["canonical_name", "scholar_id", "scopus_id", "wos_id", "orcid"],
+    "master_publications": ["title", "doi", "master_author_ids", "updated_at"],
+    "scholar_authors": ["scholar_id", "name"],
+    "scholar_papers": ["scholar_id", "title"],
+    "scopus_authors": ["scopus_id", "name"],
+    "scopus_papers": ["paper_key", "scopus_id", "title"],
+    "wos_authors": ["wos_id", "name"],
+    "wos_papers": ["paper_key", "wos_id", "title"],
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS master_authors_scholar_idx ON master_authors (scholar_id)",
+    "CREATE INDEX IF NOT EXISTS master_authors_scopus_idx ON master_authors (scopus_id)",
+    "CREATE INDEX IF NOT EXISTS master_authors_wos_idx ON master_authors (wos_id)",
+    "CREATE INDEX IF NOT EXISTS master_authors_orcid_idx ON master_authors (orcid)",
+    "CREATE INDEX IF NOT EXISTS master_publications_doi_idx ON master_publications (doi)",
+    "CREATE INDEX IF NOT EXISTS master_publications_updated_at_idx ON master_publications (updated_at, id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS scholar_authors_scholar_id_uq ON scholar_authors (scholar_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS scholar_papers_scholar_id_title_uq ON scholar_papers (scholar_id, title)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS scopus_authors_scopus_id_uq ON scopus_authors (scopus_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS scopus_papers_paper_key_uq ON scopus_papers (paper_key)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS wos_authors_wos_id_uq ON wos_authors (wos_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS wos_papers_paper_key_uq ON wos_papers (paper_key)",
+]
+
+# Tables whose updated_at is stamped on every write (the trigger in schema_updates.sql)
+TOUCH_UPDATED_AT = {"master_publications"}
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _encode(value):
+    return json.dumps(value) if isinstance(value, (list, dict)) else value
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+class SqliteStorage:
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS _json_columns (tbl TEXT, col TEXT, PRIMARY KEY (tbl, col))")
+        self.columns = {}
+        self.json_columns = {}
+        for tbl, cols in SCHEMA.items():
+            self._ensure_columns(tbl, cols)
+        for ddl in INDEXES:
+            self.conn.execute(ddl)
+        for tbl, col in self.conn.execute("SELECT tbl, col FROM _json_columns"):
+            self.json_columns.setdefault(tbl, set()).add(col)
+        self.conn.commit()
+
+    def table(self, name):
+        return SqliteQuery(self, name)
+
+    # ---- schema-on-write ----
+    def _table_columns(self, tbl):
+        if tbl not in self.columns:
+            rows = self.conn.execute(f"PRAGMA table_info({_quote(tbl)})").fetchall()
+            self.columns[tbl] = {r["name"] for r in rows}
+        return self.columns[tbl]
+
+    def _ensure_columns(self, tbl, cols, sample=None):
+        existing = self._table_columns(tbl)
+        if not existing:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(tbl)} (id TEXT PRIMARY KEY)")
+            existing.add("id")
+        for col in cols:
+            if col not in existing:
+                self.conn.execute(f"ALTER TABLE {_quote(tbl)} ADD COLUMN {_quote(col)}")
+                existing.add(col)
+        for row in sample or []:
+            for col, value in row.items():
+                if isinstance(value, (list, dict)) and col not in self.json_columns.get(tbl, ()):
+                    self.conn.execute("INSERT OR IGNORE INTO _json_columns VALUES (?, ?)", (tbl, col))
+                    self.json_columns.setdefault(tbl, set()).add(col)
+
+    def _decode(self, tbl, row):
+        out = dict(row)
+        for col in self.json_columns.get(tbl, ()):
+            if isinstance(out.get(col), str):
+                out[col] = json.loads(out[col])
+        return out
+
+class SqliteQuery:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.op = "select"
+        self.columns = "*"
+        self.count_mode = None
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.orders = []
+        self.offset = None
+        self.limit_n = None
+
+    # ---- operations ----
+    def select(self, columns="*", count=None):
+        self.op, self.columns, self.count_mode = "select", columns, count
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = "insert", rows
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def upsert(self, rows, on_conflict="id"):
+        self.op, self.payload, self.on_conflict = "upsert", rows, on_conflict
+        return self
+
+    # ---- filters / modifiers ----
+    def _filter(self, col, sql_op, value):
+        self.filters.append((col, sql_op, value))
+        return self
+
+    def eq(self, col, value): return self._filter(col, "=", value)
+    def neq(self, col, value): return self._filter(col, "!=", value)
+    def gt(self, col, value): return self._filter(col, ">", value)
+    def gte(self, col, value): return self._filter(col, ">=", value)
+    def lt(self, col, value): return self._filter(col, "<", value)
+    def lte(self, col, value): return self._filter(col, "<=", value)
+    def in_(self, col, values): return self._filter(col, "in", list(values))
+    def contains(self, col, values): return self._filter(col, "contains", list(values))
+
+    def order(self, col, desc=False):
+        self.orders.append((col, desc))
+        return self
+
+    def range(self, start, end):
+        self.offset, self.limit_n = start, end - start + 1
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    # ---- SQL generation ----
+    def _where(self):
+        known = self.store._table_columns(self.name)
+        clauses, params = [], []
+        for col, op, value in self.filters:
+            if col not in known:
+                clauses.append("0")  # unknown column never matches (PostgREST would 400)
+                continue
+            qc = _quote(col)
+            if op == "in":
+                if not value:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{qc} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            elif op == "contains":
+                for v in value:
+                    clauses.append(f"EXISTS (SELECT 1 FROM json_each({qc}) WHERE value = ?)")
+                    params.append(v)
+            else:
+                clauses.append(f"{qc} {op} ?")
+                params.append(_encode(value))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def execute(self):
+        metrics.note_request()
+        with self.store.lock:
+            result = getattr(self, "_exec_" + self.op)()
+            self.store.conn.commit()
+            return result
+
+    def _exec_select(self):
+        tbl = _quote(self.name)
+        if not self.store._table_columns(self.name):
+            return SimpleNamespace(data=[], count=0)
+        where, params = self._where()
+        count = None
+        if self.count_mode:
+            count = self.store.conn.execute(f"SELECT COUNT(*) FROM {tbl}{where}", params).fetchone()[0]
+
+        known = self.store._table_columns(self.name)
+        wanted = [c.strip() for c in self.columns.split(",")] if self.columns.strip() != "*" else None
+        cols = ", ".join(_quote(c) for c in wanted if c in known) if wanted else "*"
+        sql = f"SELECT {cols or 'id'} FROM {tbl}{where}"
+        if self.orders:
+            sql += " ORDER BY " + ", ".join(f"{_quote(c)} {'DESC' if d else 'ASC'}" for c, d in self.orders if c in known)
+        if self.limit_n is not None:
+            sql += f" LIMIT {int(self.limit_n)}"
+            if self.offset:
+                sql += f" OFFSET {int(self.offset)}"
+        rows = [self.store._decode(self.name, r) for r in self.store.conn.execute(sql, params)]
+        if wanted:
+            rows = [{c: r.get(c) for c in wanted} for r in rows]  # missing columns read as NULL
+        return SimpleNamespace(data=rows, count=count)
+
+    def _prepare_rows(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        rows = [dict(r) for r in rows]
+        for r in rows:
+            r.setdefault("id", str(uuid.uuid4()))
+            if self.name in TOUCH_UPDATED_AT:
+                r["updated_at"] = _now()
+        cols = sorted({c for r in rows for c in r})
+        self.store._ensure_columns(self.name, cols, rows)
+        return rows, cols
+
+    def _exec_insert(self):
+        rows, cols = self._prepare_rows()
+        sql = f"INSERT INTO {_quote(self.name)} ({', '.join(map(_quote, cols))}) VALUES ({', '.join('?' * len(cols))})"
+        self.store.conn.executemany(sql, [[_encode(r.get(c)) for c in cols] for r in rows])
+        return SimpleNamespace(data=rows, count=None)
+
+    def _exec_upsert(self):
+        rows, cols = self._prepare_rows()
+        keys = [k.strip() for k in self.on_conflict.split(",")]
+        if keys != ["id"]:
+            # ON CONFLICT needs a unique index on the target; create it on first use
+            self.store.conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(self.name + '_' + '_'.join(keys) + '_uq')} "
+                f"ON {_quote(self.name)} ({', '.join(map(_quote, keys))})")
+        # merge-duplicates: only the sent columns change, and an existing row keeps its id
+        updates = [c for c in cols if c not in keys and c != "id"]
+        sql = (f"INSERT INTO {_quote(self.name)} ({', '.join(map(_quote, cols))}) VALUES ({', '.join('?' * len(cols))}) "
+               f"ON CONFLICT ({', '.join(map(_quote, keys))}) DO "
+               + (f"UPDATE SET {', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in updates)}" if updates else "NOTHING"))
+        self.store.conn.executemany(sql, [[_encode(r.get(c)) for c in cols] for r in rows])
+        return SimpleNamespace(data=rows, count=None)
+
+    def _exec_update(self):
+        values = dict(self.payload)
+        if self.name in TOUCH_UPDATED_AT:
+            values["updated_at"] = _now()
+        self.store._ensure_columns(self.name, list(values), [values])
+        where, params = self._where()
+        sets = ", ".join(f"{_quote(c)} = ?" for c in values)
+        self.store.conn.execute(f"UPDATE {_quote(self.name)} SET {sets}{where}", [_encode(v) for v in values.values()] + params)
+        return SimpleNamespace(data=[], count=None)
@@ -1,8 +1,41 @@
-from supabase import create_client
-from portable_scraper.core.config import app_config as config
-
-# 🟢 Dot notation is mandatory for SimpleNamespace objects
-supabase = create_client(
-    config.supabase_url, 
-    config.supabase_key
-)
\ No newline at end of file
+import hashlib
+import os
+from portable_scraper.core.config import app_config as config, resolve_path
+
+# 🟢 storage_backend picks what `supabase` is: the hosted Supabase client, or the
+# embedded SQLite store (same chain API) for offline runs and benchmarks.
+if getattr(config, "storage_backend", "supabase") == "sqlite":
+    from portable_scraper.core.storage import SqliteStorage
+    supabase = SqliteStorage(resolve_path(getattr(config, "sqlite_path", "cache/local_store.sqlite3")))
+else:
+    from supabase import create_client
+
+    # 🟢 Dot notation is mandatory for SimpleNamespace objects
+    supabase = create_client(
+        config.supabase_url, 
+        config.supabase_key
+    )
+
+    # 📈 Count every PostgREST request for the metrics spans. The postgrest client
+    # is created lazily and rebuilt on auth changes, so a rebuilt session simply
+    # stops being counted rather than failing.
+    try:
+        from portable_scraper.core import metrics
+        supabase.postgrest.session.event_hooks["request"].append(lambda request: metrics.note_request())
+    except Exception as e:
+        print(f"⚠️ Request metrics unavailable for the Supabase client: {e}")
+
+def backend_cache_folder():
+    """
+    Cache folder for state that describes what one backend holds (staging hashes,
+    master mirror, spooled writes). The hosted backend keeps cache_folder itself;
+    every SQLite store gets its own subfolder, so switching storage_backend or
+    sqlite_path never trusts another store's caches.
+    """
+    folder = resolve_path(getattr(config, "cache_folder", "cache"))
+    if getattr(config, "storage_backend", "supabase") == "sqlite":
+        store = resolve_path(getattr(config, "sqlite_path", "cache/local_store.sqlite3"))
+        tag = hashlib.sha1(store.encode("utf-8")).hexdigest()[:10]
+        folder = os.path.join(folder, "sqlite", f"{os.path.splitext(os.path.basename(store))[0]}-{tag}")
+    os.makedirs(folder, exist_ok=True)
+    return folder
@@ -0,0 +1,89 @@
+import zlib
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# ==========================================
+# 1. MINHASH SIGNATURES OVER TITLE SHINGLES
+# ==========================================
+# Titles arrive already normalized (lowercase a-z0-9, no spaces), so character
+# k-grams are the natural shingles. Two titles scoring > 92 on fuzz.ratio share
+# most of their 3-grams, which is what the band/row settings are tuned for:
+# the collision threshold is roughly (1 / bands) ** (1 / rows).
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+def title_shingles(clean_title, k=3):
+    if len(clean_title) <= k:
+        return {clean_title}
+    return {clean_title[i:i + k] for i in range(len(clean_title) - k + 1)}
+
+def build_lsh_index(bands=64, rows=3, shingle_size=3, seed=7):
+    """Empty LSH index. `bands * rows` hash permutations are drawn once per index."""
+    rng = np.random.RandomState(seed)
+    num_perm = bands * rows
+    return {
+        "bands": bands,
+        "rows": rows,
+        "k": shingle_size,
+        "a": rng.randint(1, 2**31 - 1, size=num_perm).astype(np.uint64),
+        "b": rng.randint(0, 2**31 - 1, size=num_perm).astype(np.uint64),
+        "buckets": {},
+    }
+
+def minhash_signature(lsh, clean_title):
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in title_shingles(clean_title, lsh["k"])), dtype=np.uint64)
+    # (a * h + b) mod p for every permutation at once; a, b < 2^31 and h < 2^32 keeps it inside uint64
+    permuted = (np.outer(lsh["a"], hashes) + lsh["b"][:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+def _band_keys(lsh, signature):
+    r = lsh["rows"]
+    return [(band, signature[band * r:(band + 1) * r].tobytes()) for band in range(lsh["bands"])]
+
+def lsh_add(lsh, position, clean_title):
+    if not clean_title: return
+    for key in _band_keys(lsh, minhash_signature(lsh, clean_title)):
+        lsh["buckets"].setdefault(key, []).append(position)
+
+def lsh_candidates(lsh, clean_title):
+    """Positions of indexed titles sharing at least one band with the query."""
+    if not clean_title: return set()
+    found = set()
+    for key in _band_keys(lsh, minhash_signature(lsh, clean_title)):
+        found.update(lsh["buckets"].get(key, ()))
+    return found
+
+# ==========================================
+# 2. RECALL REPORT AGAINST THE EXHAUSTIVE MATCHER
+# ==========================================
+def lsh_recall_report(choices, queries, bands=64, rows=3, threshold=92):
+    """
+    Indexes `choices` (normalized titles), then compares the LSH-filtered best match
+    for every query with the exhaustive cdist best match. Returns a summary dict.
+    """
+    lsh = build_lsh_index(bands, rows)
+    for pos, title in enumerate(choices):
+        lsh_add(lsh, pos, title)
+
+    scores = process.cdist(queries, choices, scorer=fuzz.ratio, score_cutoff=threshold, workers=-1)
+    expected = hits = candidate_total = 0
+    for qi, query in enumerate(queries):
+        cands = lsh_candidates(lsh, query)
+        candidate_total += len(cands)
+        if not query or scores.shape[1] == 0 or scores[qi].max() <= threshold:
+            continue
+        expected += 1
+        if any(fuzz.ratio(query, choices[c]) > threshold for c in cands):
+            hits += 1
+
+    report = {
+        "bands": bands,
+        "rows": rows,
+        "queries": len(queries),
+        "exhaustive_matches": expected,
+        "lsh_matches": hits,
+        "recall": hits / expected if expected else 1.0,
+        "avg_candidates": candidate_total / len(queries) if queries else 0.0,
+    }
+    print(f"   📐 LSH b={bands} r={rows}: recall {report['recall']:.2%} ({hits}/{expected}), "
+          f"{report['avg_candidates']:.1f} candidates/query vs {len(choices)} exhaustive.")
+    return report
@@ -0,0 +1,207 @@
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from portable_scraper.core.config import app_config as config, resolve_path
+from portable_scraper.core import async_store, metrics
+
+# ==========================================
+# 1. WRITE-BEHIND QUEUE FOR STAGING WRITES
+# ==========================================
+# push_* hand their cleaned rows to enqueue() and return immediately; one flusher
+# thread drains the queue in per-table batches. Upserts are coalesced on their
+# conflict key (last write wins), so a re-scrape that lands before the previous
+# flush only costs one row. A bucket flushes when it reaches write_queue_max_rows
+# or its oldest row is write_queue_max_delay seconds old.
+#
+# Rows are never dropped: transient failures (network, 5xx, 429) put the batch
+# back with exponential backoff + jitter, rows Postgres rejects outright are
+# appended to cache/write_queue_deadletter.jsonl for inspection and replay, and
+# rows still queued at exit are handed to the durable spool (spool.py).
+_buckets = {}      # (table, on_conflict) -> {"rows": {coalesce key: row}, "since": t, "callbacks": [...]}
+_cond = threading.Condition()
+_flusher = None
+_in_flight = 0
+_stats = {"flushes": 0, "rows_written": 0, "retries": 0, "dead_lettered": 0,
+          "last_flush_ms": 0.0, "total_flush_ms": 0.0, "backoff_s": 0.0}
+
+def _coalesce_key(row, on_conflict):
+    if not on_conflict:
+        return id(row)  # plain inserts never coalesce
+    return tuple(row.get(k.strip()) for k in on_conflict.split(","))
+
+def enqueue(table, rows, on_conflict="id", on_written=None):
+    """
+    Queues rows for a background upsert (`on_conflict=None` inserts instead).
+    `on_written(rows)` runs on the flusher thread with the rows that were stored.
+    """
+    if not rows:
+        return
+    _ensure_flusher()
+    with _cond:
+        bucket = _buckets.setdefault((table, on_conflict), {"rows": {}, "since": time.time(), "callbacks": []})
+        for row in rows:
+            bucket["rows"][_coalesce_key(row, on_conflict)] = row
+        if on_written:
+            bucket["callbacks"].append(on_written)
+        _cond.notify_all()
+
+def queue_stats():
+    """Queue depth and flush latency, for the log panel and the dashboard."""
+    with _cond:
+        depth = {f"{t}" + (f" ({c})" if c else " (insert)"): len(b["rows"]) for (t, c), b in _buckets.items()}
+        oldest = min((b["since"] for b in _buckets.values()), default=None)
+        stats = dict(_stats)
+        stats.update({
+            "depth": sum(depth.values()) + _in_flight,
+            "depth_by_table": depth,
+            "in_flight": _in_flight,
+            "oldest_age_s": round(time.time() - oldest, 2) if oldest else 0.0,
+            "avg_flush_ms": round(_stats["total_flush_ms"] / _stats["flushes"], 1) if _stats["flushes"] else 0.0,
+        })
+    return stats
+
+def flush(timeout=None):
+    """Blocks until every queued row is written (or `timeout` seconds pass). Returns True when drained."""
+    deadline = time.time() + timeout if timeout is not None else None
+    with _cond:
+        for bucket in _buckets.values():
+            bucket["since"] = 0  # due now
+        _cond.notify_all()
+        while _buckets or _in_flight:
+            remaining = deadline - time.time() if deadline else None
+            if remaining is not None and remaining <= 0:
+                return False
+            _cond.wait(remaining if remaining is not None else 1.0)
+    return True
+
+# ==========================================
+# 2. FLUSHER THREAD
+# ==========================================
+def _ensure_flusher():
+    global _flusher
+    with _cond:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="write-behind", daemon=True)
+            _flusher.start()
+
+def _due_bucket():
+    """Picks a bucket that is full or old enough. Caller holds _cond."""
+    max_rows = getattr(config, "write_queue_max_rows", 500)
+    max_delay = getattr(config, "write_queue_max_delay", 2.0)
+    now = time.time()
+    for key, bucket in _buckets.items():
+        if len(bucket["rows"]) >= max_rows or now - bucket["since"] >= max_delay:
+            return key
+    return None
+
+def _flush_loop():
+    global _in_flight
+    attempt = 0
+    while True:
+        with _cond:
+            key = _due_bucket()
+            while key is None:
+                _cond.wait(0.25)
+                key = _due_bucket()
+            bucket = _buckets.pop(key)
+            _in_flight += len(bucket["rows"])
+
+        table, on_conflict = key
+        rows = list(bucket["rows"].values())
+        ok = _write_batch(table, on_conflict, rows, bucket["callbacks"])
+
+        with _cond:
+            _in_flight -= len(rows)
+            if not ok:
+                _requeue(key, bucket)
+            _cond.notify_all()
+
+        if ok:
+            attempt = 0
+        else:
+            attempt += 1
+            base = getattr(config, "write_queue_backoff_base", 1.0)
+            cap = getattr(config, "write_queue_backoff_max", 60.0)
+            delay = random.uniform(0, min(cap, base * 2 ** attempt))  # full jitter
+            _stats["retries"] += 1
+            _stats["backoff_s"] = round(delay, 2)
+            print(f"   ⏳ Write-behind: {table} unavailable, retrying {len(rows)} rows in {delay:.1f}s (attempt {attempt}).")
+            time.sleep(delay)
+
+def _requeue(key, bucket):
+    """Puts a failed batch back without overwriting rows queued since (they are newer). Caller holds _cond."""
+    current = _buckets.get(key)
+    if current is None:
+        _buckets[key] = bucket
+        return
+    for ck, row in bucket["rows"].items():
+        current["rows"].setdefault(ck, row)
+    current["callbacks"] = bucket["callbacks"] + current["callbacks"]
+    current["since"] = min(current["since"], bucket["since"])
+
+def _write_batch(table, on_conflict, rows, callbacks):
+    """True when the batch is settled (written or dead-lettered), False to retry later."""
+    # Imported here: db enqueues into this module, so a top-level import would be circular
+    from portable_scraper.core.db import bulk_upsert, bulk_insert
+
+    started = time.perf_counter()
+    try:
+        with metrics.span("write_queue.flush", table=table) as sp:
+            sp.add_items(len(rows))
+            if on_conflict:
+                failures = bulk_upsert(table, rows, on_conflict=on_conflict)
+            else:
+                failures = bulk_insert(table, rows)
+    except Exception as e:
+        if async_store.is_transient(e):
+            return False
+        # Retrying cannot fix a non-transient error and would block every batch behind it
+        print(f"   ⚠️ Write-behind: unexpected error on {table} ({e}).")
+        _dead_letter(table, on_conflict, [(row, e) for row in rows])
+        return True
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _stats["flushes"] += 1
+    _stats["last_flush_ms"] = round(elapsed_ms, 1)
+    _stats["total_flush_ms"] += elapsed_ms
+    _stats["backoff_s"] = 0.0
+
+    failed = {id(row) for row, _ in failures}
+    if failures:
+        _dead_letter(table, on_conflict, failures)
+    written = [row for row in rows if id(row) not in failed]
+    _stats["rows_written"] += len(written)
+    for callback in callbacks:
+        try:
+            callback(written)
+        except Exception as e:
+            print(f"   ⚠️ Write-behind callback for {table} failed: {e}")
+    return True
+
+def _dead_letter(table, on_conflict, failures):
+    folder = resolve_path(getattr(config, "cache_folder", "cache"))
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "write_queue_deadletter.jsonl"), "a", encoding="utf-8") as f:
+        for row, error in failures:
+            f.write(json.dumps({"table": table, "on_conflict": on_conflict, "error": str(error), "row": row}, default=str) + "\n")
+    _stats["dead_lettered"] += len(failures)
+    print(f"   🗃️ {len(failures)} rejected {table} rows saved to the dead-letter file.")
+
+@atexit.register
+def _drain_on_exit():
+    """Last chance flush; whatever is still undelivered goes to the durable spool."""
+    if not (_buckets or _in_flight):
+        return
+    print(f"   ⏳ Flushing {queue_stats()['depth']} queued rows before exit...")
+    if flush(timeout=getattr(config, "write_queue_exit_timeout", 30)):
+        return
+    from portable_scraper.core.spool import spool_writes
+    with _cond:
+        leftovers = [(table, on_conflict, list(b["rows"].values())) for (table, on_conflict), b in _buckets.items()]
+        _buckets.clear()
+    for table, on_conflict, rows in leftovers:
+        spool_writes(table, on_conflict, rows)
+    print(f"   💾 {sum(len(r) for _, _, r in leftovers)} undelivered rows saved to the spool for the next run.")
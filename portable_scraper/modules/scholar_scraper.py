@@ -9,6 +9,7 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from portable_scraper.core.logger import setup_logger
+from portable_scraper.core.metrics import PhaseTimer
 logger = setup_logger("FacultyScraper") #
 
 # ==========================================
@@ -77,9 +78,12 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
 
     driver = webdriver.Chrome(options=options)
     wait = WebDriverWait(driver, 15)
+    phases = PhaseTimer("scholar")
 
     try:
         # --- PHASE 1: ENTRY ---
+        phases.start("search")
+        phases.request()
         search_query = f"{first_name} {last_name} Google Scholar {affiliation}".strip()
         driver.get(f"https://www.google.com/search?q={search_query.replace(' ', '+')}")
         print(f"🌐 PHASE 1: Direct Entry. Waiting {TIMEOUTS['INITIAL_SEARCH_WAIT']}s...")
@@ -109,6 +113,7 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
         check_for_captcha(driver)
 
         # --- PHASE 2: EXPANSION ---
+        phases.start("expansion")
         print("⏬ PHASE 2: Expanding publications...")
         prev_count = 0
         rows = []  # initialise so len(rows) is safe if loop never runs
@@ -122,14 +127,17 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
                 if more_btn.is_enabled() and more_btn.get_attribute("disabled") is None and curr_count > prev_count:
                     prev_count = curr_count
                     driver.execute_script("arguments[0].click();", more_btn)
+                    phases.request()
                     time.sleep(TIMEOUTS["EXPANSION_WAIT"])
                 else: 
                     break
             except Exception: 
                 break
+        phases.items(len(rows))
         print(f"   ✅ Total {len(rows)} papers visible.")
 
         # --- PHASE 3: HEADER ---
+        phases.start("header")
         # Guard: ensure Scholar_ID is extractable before building the profile dict
         scholar_id_match = re.search(r'user=([^&]+)', driver.current_url)
         if not scholar_id_match:
@@ -161,6 +169,7 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
         })
 
         # --- PHASE 4: MULTI-TAB EXHAUSTIVE SCRAPE ---
+        phases.start("detail_tabs")
         print(f"⚙️   PHASE 4: Executing Tabbed Extraction...")
         papers = []
         link_elements = driver.find_elements(By.CLASS_NAME, "gsc_a_at")
@@ -174,6 +183,7 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
                 
                 # Open detail page in a new tab
                 driver.execute_script(f"window.open('{paper_url}', '_blank');")
+                phases.request()
                 
                 # Sync: Wait for the browser to register the new tab
                 start_t = time.time()
@@ -220,6 +230,7 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
                         continue
 
                 papers.append(p_data)
+                phases.items()
                 
                 # Cleanup detail tab
                 driver.close()
@@ -235,6 +246,7 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
         print(f"   ✅ Extraction Complete. Processed {len(papers)} papers.")
 
         # 🟢 PHASE 5: Generating Excels & Preparing Payload
+        phases.start("save")
         print("💾 PHASE 5: Generating Excel Backups...")
         os.makedirs(output_dir, exist_ok=True)
         clean_name = f"{last_name}_{first_name[0]}"
@@ -261,6 +273,7 @@ def run_scholar_scraper(first_name, last_name, affiliation="", output_dir=""):
         return None, None
 
     finally:
+        phases.finish()
         # Final cleanup ensures browser closes even on fatal crash
         try:
             driver.quit()
@@ -14,6 +14,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from portable_scraper.core.logger import setup_logger
+from portable_scraper.core.metrics import PhaseTimer
 logger = setup_logger("FacultyScraper") #
 
 # ==========================================
@@ -152,6 +153,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
 
     driver = None
     scrape_successful = False
+    phases = PhaseTimer("scopus")
 
     try:
         time.sleep(3)
@@ -163,6 +165,8 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         # ---------------------------------------------------------
         # PHASE 1: STEALTH LAUNCH & AUTHENTICATION
         # ---------------------------------------------------------
+        phases.start("login")
+        phases.request()
         print(f"\n🌐 PHASE 1: Opening Scopus.")
         print("   👉 Please log in using your institutional credentials.")
         print(f"   ⏳ You have {TIMEOUTS['LOGIN_WAIT']} seconds before the sequence begins...")
@@ -174,8 +178,10 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         # ---------------------------------------------------------
         # PHASE 2: AUTOMATED SEARCH & NAVIGATION
         # ---------------------------------------------------------
+        phases.start("search")
         print("\n🔍 PHASE 2: Navigating to Author Search...")
         driver.get("https://www.scopus.com/freelookup/form/author.uri")
+        phases.request()
         time.sleep(5)
         
         try:
@@ -193,6 +199,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         first_box.send_keys(first_name)
         
         safe_click(wait, By.ID, "authorSubmitBtn")
+        phases.request()
         time.sleep(TIMEOUTS["SEARCH_RESULTS_WAIT"])
 
         check_for_captcha(driver)
@@ -245,6 +252,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         # ---------------------------------------------------------
         # PHASE 3: STAGE 1 EXTRACTION (The Initial Profile)
         # ---------------------------------------------------------
+        phases.start("profile")
         print("\n👤 PHASE 3: Extracting Initial Profile Metadata...")
         profile = {
             "Name": "", "Scopus_ID": "", "ORCID": "", "Organization": "",
@@ -297,6 +305,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         # PHASE 4: STAGE 2 EXTRACTION (The Metrics Unlock)
         # ---------------------------------------------------------
         # RESTORED: This entire logical block was previously missing
+        phases.start("metrics_unlock")
         print("\n🔓 PHASE 4: Clicking 'Edit profile' (Optional verification step)...")
         try:
             safe_click(wait, By.XPATH, "//span[contains(text(),'Edit profile')]")
@@ -318,6 +327,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         # ---------------------------------------------------------
         # PHASE 5: STAGE 3 EXTRACTION (The Documents Pagination)
         # ---------------------------------------------------------
+        phases.start("pagination")
         print("\n📄 PHASE 5: Activating 'Documents' tab...")
         try:
             doc_tab = driver.find_elements(By.XPATH, "//a[contains(., 'Documents') or contains(., 'documents')] | //span[contains(., 'Documents') or contains(., 'documents')]")
@@ -335,6 +345,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         while True:
             check_for_captcha(driver) 
             print(f"   📄 Scraping Page {page_num}...")
+            phases.request()
             time.sleep(4) 
             
             rows = driver.find_elements(By.CSS_SELECTOR, "table tbody tr")
@@ -363,6 +374,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
                     if paper["Title"] and paper["Title"] not in seen_titles:
                         seen_titles.add(paper["Title"])
                         papers.append(paper)
+                        phases.items()
                 except:
                     continue
 
@@ -389,6 +401,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         # ---------------------------------------------------------
         # PHASE 6: CONSOLIDATION & PAYLOAD PACKAGING
         # ---------------------------------------------------------
+        phases.start("save")
         print("\n💾 PHASE 6: Saving Data...")
         os.makedirs(output_dir, exist_ok=True)
         clean_name = "".join(x for x in profile['Name'] if x.isalnum() or x in " _-")
@@ -415,6 +428,7 @@ def run_scopus_scraper(first_name: str, last_name: str, output_dir: str):
         return None, None
 
     finally:
+        phases.finish()
         print("\n🧹 Initiating system cleanup...")
         if driver:
             try: driver.quit() 
@@ -13,6 +13,7 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
 from portable_scraper.core.logger import setup_logger
+from portable_scraper.core.metrics import PhaseTimer
 logger = setup_logger("FacultyScraper")
 
 # ==========================================
@@ -309,6 +310,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
     """Takes the existing debug port, attaches Selenium, extracts data, and returns the payload."""
     driver = None
     scrape_successful = False 
+    phases = PhaseTimer("wos")
     
     try:
         print("\n🔗 Attaching robot to the browser...")
@@ -330,6 +332,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
 
         check_for_captcha(driver) 
 
+        phases.start("profile")
         print("\n👤 Extracting Author Profile...")
         body_text = driver.find_element(By.TAG_NAME, "body").text
         profile_data = parse_profile_text(body_text)
@@ -339,6 +342,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
         seen_records = set()
         papers_data = []
         
+        phases.start("pagination")
         print("\n⚙️ Beginning autonomous category iteration and pagination...")
         
         try:
@@ -369,6 +373,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
                     driver.execute_script("arguments[0].click();", chip) 
                     
                 human_delay(5, 8) 
+                phases.request()
                 active_category = re.sub(r'\(\d+\)', '', chip_text).strip()
                 
                 check_for_captcha(driver)
@@ -402,6 +407,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
                     check_for_captcha(driver) 
                     
                     print(f"   📄 Scraping Page {page_num}...")
+                    phases.request()
                     driver.execute_script("window.scrollTo(0, 0);")
                     human_delay(2, 3)
 
@@ -437,6 +443,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
                                         parsed_paper["DOI"] = ""
 
                                     papers_data.append(parsed_paper)
+                                    phases.items()
                         
                         current_scroll += scroll_step
                         driver.execute_script(f"window.scrollTo(0, {current_scroll});")
@@ -469,6 +476,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
 
         print(f"\n   ✅ Done! Captured {len(papers_data)} TOTAL unique publications.")
 
+        phases.start("save")
         # 🟢 FINAL HANDOFF LAYER — Always save profile; publications only if non-empty
         os.makedirs(output_dir, exist_ok=True)
         clean_name = "".join(x for x in profile_data['Name'] if x.isalnum() or x in " _-")
@@ -496,6 +504,7 @@ def attach_and_scrape_wos(debug_port, chrome_process, output_dir: str):
         # return None, None
 
     finally:
+        phases.finish()
         print("\n🧹 Initiating system cleanup...")
         if driver:
             try: driver.quit() 
@@ -0,0 +1,34 @@
+import argparse
+import pandas as pd
+from portable_scraper.core.config import app_config
+from portable_scraper.core.pipeline import run_roster_pipeline
+
+def load_roster(path):
+    """Reads First / Last / Affiliation columns from a .csv or .xlsx roster."""
+    df = pd.read_csv(path) if path.lower().endswith(".csv") else pd.read_excel(path)
+    df = df.fillna("")
+    roster = []
+    for row in df.to_dict("records"):
+        first, last = str(row.get("First", "")).strip(), str(row.get("Last", "")).strip()
+        if first and last:
+            roster.append((first, last, str(row.get("Affiliation", "")).strip()))
+    return roster
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape a faculty roster with scraping and database stages overlapped.")
+    parser.add_argument("roster", help="CSV/Excel file with First, Last and (optional) Affiliation columns.")
+    parser.add_argument("--source", choices=["scholar", "scopus"], default="scholar")
+    parser.add_argument("--queue-size", type=int, default=None, help="Payloads buffered between stages (backpressure bound).")
+    args = parser.parse_args()
+
+    roster = load_roster(args.roster)
+    if args.source == "scholar":
+        from portable_scraper.modules.scholar_scraper import run_scholar_scraper
+        scrape = lambda e: run_scholar_scraper(e[0], e[1], e[2], app_config.output_folder)
+    else:
+        from portable_scraper.modules.scopus_scraper import run_scopus_scraper
+        scrape = lambda e: run_scopus_scraper(e[0], e[1], app_config.output_folder)
+
+    results = run_roster_pipeline(args.source, roster, scrape, queue_size=args.queue_size)
+    for r in results:
+        print(f"{'✅' if r['ok'] else '📦' if r['pending'] else '❌'} {r['name']}" + (f" — {r['error']}" if r["error"] else ""))